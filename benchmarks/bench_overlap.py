@@ -0,0 +1,118 @@
+"""
+Benchmarks `LeaveRequestService.valid_leave_request_date_range` for users with a
+growing number of historical leave requests.
+
+Run with `python -m benchmarks.bench_overlap`.
+"""
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Tuple
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.models.leave_requests import LeaveRequest, LeaveRequestStatus
+from src.models.users import User
+from src.services.leave_requests import LeaveRequestService
+
+HISTORY_SIZES = (10, 100, 1_000, 10_000)
+REPEATS = 200
+
+
+def seed(session: Session, history_size: int) -> Tuple[int, datetime]:
+    """
+    Creates a user with `history_size` back-to-back past leave requests.
+    :param session: The session to seed with.
+    :param history_size: The number of leave requests to create.
+    :return: The id of the user and the day after their last leave request.
+    """
+    user = User(
+        full_name="bench", username=f"bench-{history_size}", hashed_password=b""
+    )
+    session.add(user)
+    session.commit()
+
+    day = datetime(2000, 1, 1)
+    session.bulk_insert_mappings(
+        LeaveRequest,
+        [
+            {
+                "requester_id": user.id,
+                "reason": "history",
+                "status": LeaveRequestStatus.approved,
+                "start_date": day + timedelta(days=i),
+                "end_date": day + timedelta(days=i),
+            }
+            for i in range(history_size)
+        ],
+    )
+    session.commit()
+    return user.id, day + timedelta(days=history_size)
+
+
+async def python_loop(
+    session: AsyncSession, requester_id: int, date_range: Tuple[datetime, datetime]
+) -> bool:
+    """The previous implementation, kept as a reference point."""
+    query = select(LeaveRequest).where(LeaveRequest.requester_id == requester_id)
+    leave_requests: List[LeaveRequest] = (await session.exec(query)).all()
+    for leave_request in leave_requests:
+        if leave_request.start_date <= date_range[0] <= leave_request.end_date:
+            return False
+        if leave_request.start_date <= date_range[1] <= leave_request.end_date:
+            return False
+    return True
+
+
+async def time_per_call(func: Callable[[], Awaitable[object]], number: int) -> float:
+    """
+    Awaits a coroutine function repeatedly.
+    :param func: The coroutine function to time.
+    :param number: The number of times to await it.
+    :return: The average number of seconds per call.
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        await func()
+    return (time.perf_counter() - start) / number
+
+
+async def run(directory: str) -> None:
+    engine = create_engine(f"sqlite:///{directory}/bench.db")
+    SQLModel.metadata.create_all(engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/bench.db")
+
+    print(f"{'history':>8} {'python loop (us)':>18} {'exists (us)':>12}")
+    for history_size in HISTORY_SIZES:
+        with Session(engine) as session:
+            requester_id, next_day = seed(session, history_size)
+        date_range = (next_day, next_day + timedelta(days=2))
+
+        async with AsyncSession(async_engine) as session:
+            service = LeaveRequestService(session)
+            loop_time = await time_per_call(
+                lambda: python_loop(session, requester_id, date_range),
+                number=max(1, REPEATS // 20),
+            )
+            session.expunge_all()
+            exists_time = await time_per_call(
+                lambda: service.valid_leave_request_date_range(
+                    requester_id, date_range, ignore_denied=True
+                ),
+                number=REPEATS,
+            )
+
+        print(f"{history_size:>8} {loop_time * 1e6:>18.1f} {exists_time * 1e6:>12.1f}")
+    await async_engine.dispose()
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    main()
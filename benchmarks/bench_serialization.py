@@ -0,0 +1,90 @@
+"""
+Measures how long it takes to turn 10k leave request rows into a JSON response body,
+with the previous path (a validated model per row, then the stdlib `json`) and the
+current one (plain dicts serialized by orjson). Also reports the gzipped size.
+
+Run with `python -m benchmarks.bench_serialization`.
+"""
+import gzip
+import json
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from typing import Any, List
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import Row
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import src.schemas.leave_requests as schemas
+from src.models.leave_requests import LeaveRequest, LeaveRequestStatus
+from src.services.leave_requests import LEAVE_REQUEST_COLUMNS
+
+ROWS = 10_000
+REPEATS = 10
+
+page_adapter = TypeAdapter(schemas.LeaveRequestPage)
+
+
+def load_rows(session: Session) -> List[Row]:
+    """
+    Inserts `ROWS` leave requests and reads them back as the service does.
+    :param session: The session to use.
+    :return: The selected rows.
+    """
+    day = datetime(2024, 1, 1)
+    session.bulk_insert_mappings(
+        LeaveRequest,
+        [
+            {
+                "requester_id": i % 100,
+                "reason": f"reason {i}",
+                "status": LeaveRequestStatus.pending,
+                "start_date": day + timedelta(days=i % 365),
+                "end_date": day + timedelta(days=i % 365 + 2),
+            }
+            for i in range(ROWS)
+        ],
+    )
+    session.commit()
+    return session.exec(select(*LEAVE_REQUEST_COLUMNS)).all()
+
+
+def validated(rows: List[Row]) -> bytes:
+    """The previous path: a model per row, then FastAPI's response model round."""
+    items = [schemas.LeaveRequestRead.model_validate(row._mapping) for row in rows]
+    page = page_adapter.validate_python({"items": items, "next_cursor": None})
+    content: Any = page_adapter.dump_python(page, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def projected(rows: List[Row]) -> bytes:
+    """The current path: plain dicts serialized by orjson."""
+    items = [row._asdict() for row in rows]
+    return orjson.dumps({"items": items, "next_cursor": None})
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/bench.db")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            rows = load_rows(session)
+
+        assert json.loads(validated(rows)) == json.loads(projected(rows))
+        print(f"serializing {ROWS} rows")
+        for name, fn in (
+            ("validated + json", validated),
+            ("dicts + orjson", projected),
+        ):
+            seconds = min(timeit.repeat(lambda: fn(rows), number=1, repeat=REPEATS))
+            print(f"{name:>17}: {seconds * 1e3:7.2f} ms")
+
+        body = projected(rows)
+        print(f"body: {len(body)} bytes, gzipped {len(gzip.compress(body))} bytes")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
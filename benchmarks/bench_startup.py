@@ -0,0 +1,39 @@
+"""
+Measures how long a worker takes to import the app, i.e., its cold start before it can
+serve requests. Each run is a fresh interpreter.
+
+Run with `python -m benchmarks.bench_startup`.
+"""
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RUNS = 10
+
+
+def time_import(module: str) -> float:
+    """
+    Imports a module in a fresh interpreter.
+    :param module: The module to import.
+    :return: The wall time in seconds, including interpreter start-up.
+    """
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True, cwd=ROOT)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    baseline = [time_import("sys") for _ in range(RUNS)]
+    runs = [time_import("src.main") for _ in range(RUNS)]
+
+    print(f"interpreter only: median {statistics.median(baseline) * 1e3:.0f} ms")
+    print(f"import src.main:  median {statistics.median(runs) * 1e3:.0f} ms")
+    print(f"                  min    {min(runs) * 1e3:.0f} ms")
+    print(f"                  max    {max(runs) * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
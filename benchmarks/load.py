@@ -0,0 +1,279 @@
+"""
+Load generator driving a weighted mix of logins, leave request creations, listings and
+approvals from concurrent virtual users, reporting the latency percentiles and
+throughput of each operation.
+
+By default the app is served in-process from a temporary SQLite database. With `--url`
+a running server is targeted instead, e.g. one started with `python -m src.server`
+against a local Postgres; the admin logs in with `ADMIN_PASSWORD` there, and requests
+rejected once the users run out of leave days are counted apart from errors.
+
+Run with `python -m benchmarks.load [--url URL] [--save-baseline]`. Exits with 1 if an
+operation's p95 is slower than the stored baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List
+
+import httpx
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from benchmarks import stats
+from src.database import ADMIN_PASSWORD, get_replica_session, get_session
+from src.main import app
+from src.models.users import User
+from src.utils import hasher
+
+# How often each operation is picked, relative to the others.
+MIX = {"login": 1, "create": 4, "list": 10, "approve": 3}
+PASSWORD = "password"
+
+
+@dataclass
+class Results:
+    """The latencies and response statuses of each operation."""
+
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: Counter = field(default_factory=Counter)
+
+    def record(self, operation: str, started: float, response: httpx.Response) -> None:
+        status_class = f"{response.status_code // 100}xx"
+        self.statuses[(operation, status_class)] += 1
+        if response.status_code < 400:
+            self.latencies[operation].append(time.perf_counter() - started)
+
+
+@dataclass
+class VirtualUser:
+    username: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Leave requests are one day long, on successive days, so they never overlap.
+    next_day: int = 1
+
+
+class LoadTest:
+    """Virtual users sharing a client, and the admin approving their leave requests."""
+
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self.client = client
+        self.admin = VirtualUser("admin")
+        self.pending: List[int] = []
+        self.results = Results()
+
+    async def login(self, user: VirtualUser, password: str = PASSWORD) -> None:
+        started = time.perf_counter()
+        response = await self.client.post(
+            "/token", data={"username": user.username, "password": password}
+        )
+        self.results.record("login", started, response)
+        response.raise_for_status()
+        user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def create(self, user: VirtualUser) -> None:
+        day = datetime.now() + timedelta(days=user.next_day)
+        user.next_day += 1
+        started = time.perf_counter()
+        response = await self.client.post(
+            "/api/create-leave-request",
+            json={
+                "reason": "load test",
+                "start_date": day.isoformat(),
+                "end_date": day.isoformat(),
+            },
+            headers=user.headers,
+        )
+        self.results.record("create", started, response)
+        if response.status_code == 201:
+            self.pending.append(response.json()["id"])
+
+    async def list(self, user: VirtualUser) -> None:
+        started = time.perf_counter()
+        response = await self.client.get(
+            "/api/get-all-leave-requests", params={"limit": 50}, headers=user.headers
+        )
+        self.results.record("list", started, response)
+
+    async def approve(self) -> None:
+        if not self.pending:
+            return
+        leave_request_id = self.pending.pop(random.randrange(len(self.pending)))
+        started = time.perf_counter()
+        response = await self.client.put(
+            f"/api/approve-leave-request/{leave_request_id}",
+            headers=self.admin.headers,
+        )
+        self.results.record("approve", started, response)
+
+    async def register(self, user: VirtualUser) -> None:
+        response = await self.client.post(
+            "/register",
+            json={
+                "username": user.username,
+                "password": PASSWORD,
+                "full_name": user.username,
+            },
+        )
+        response.raise_for_status()
+        await self.login(user)
+
+    async def drive(self, user: VirtualUser, deadline: float) -> None:
+        operations = list(MIX)
+        weights = list(MIX.values())
+        while time.perf_counter() < deadline:
+            operation = random.choices(operations, weights)[0]
+            if operation == "login":
+                await self.login(user)
+            elif operation == "create":
+                await self.create(user)
+            elif operation == "list":
+                await self.list(user)
+            else:
+                await self.approve()
+
+    async def run(self, users: List[VirtualUser], duration: float) -> float:
+        """
+        Drives the operation mix from every user until the duration has elapsed.
+        :param users: The registered and logged in users.
+        :param duration: How long to run for, in seconds.
+        :return: The wall time the run took, in seconds.
+        """
+        self.results = Results()
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.drive(user, deadline) for user in users))
+        return time.perf_counter() - started
+
+
+@asynccontextmanager
+async def in_process_app(
+    directory: str, usernames: List[str]
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Serves the app in-process from a SQLite database seeded with an admin and users
+    with enough leave days that their leave requests are never rejected for lack of
+    them.
+    :param directory: The directory to create the database in.
+    :param usernames: The users to create, with `PASSWORD` as their password.
+    :return: A context manager giving a client of the app.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/load.db")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add(
+            User(
+                username="admin",
+                full_name="admin",
+                hashed_password=hasher.hash(ADMIN_PASSWORD),
+                is_admin=True,
+            )
+        )
+        hashed_password = hasher.hash(PASSWORD)
+        session.add_all(
+            User(
+                username=username,
+                full_name=username,
+                hashed_password=hashed_password,
+                remaining_leave_days=100_000,
+            )
+            for username in usernames
+        )
+        await session.commit()
+
+    async def get_session_override() -> AsyncIterator[AsyncSession]:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_replica_session] = get_session_override
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://load"
+        ) as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, stats.Summary]:
+    usernames = [f"load-{int(time.time())}-{i}" for i in range(args.users)]
+    with tempfile.TemporaryDirectory() as directory:
+        if args.url:
+            client_context = httpx.AsyncClient(base_url=args.url, timeout=60)
+        else:
+            client_context = in_process_app(directory, usernames)
+
+        async with client_context as client:
+            load = LoadTest(client)
+            users = [VirtualUser(username) for username in usernames]
+            await load.login(load.admin, ADMIN_PASSWORD)
+            if args.url:
+                await asyncio.gather(*(load.register(user) for user in users))
+            else:
+                await asyncio.gather(*(load.login(user) for user in users))
+
+            seconds = await load.run(users, args.duration)
+
+    print(
+        "responses: "
+        + ", ".join(
+            f"{operation} {status_class} {count}"
+            for (operation, status_class), count in sorted(
+                load.results.statuses.items()
+            )
+        )
+    )
+    results = {
+        operation: stats.summarize(load.results.latencies[operation], seconds)
+        for operation in MIX
+        if load.results.latencies[operation]
+    }
+    every_latency = [
+        latency
+        for latencies in load.results.latencies.values()
+        for latency in latencies
+    ]
+    results["total"] = stats.summarize(every_latency, seconds)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument(
+        "--url", help="A running server to target, instead of the app in-process."
+    )
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20, help="In seconds.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store this run as the baseline."
+    )
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    results = asyncio.run(run(args))
+    # The in-process app and a real server don't share a baseline.
+    name = "load-server" if args.url else "load"
+    regressions = stats.report(
+        results, stats.load_baseline(name), "p95", args.tolerance
+    )
+    if args.save_baseline:
+        stats.save_baseline(name, results)
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Micro-benchmarks of the hot paths behind the leave request API: leave request
+validation, user lookups, password hashing and serialization. Each call is timed on its
+own, against a seeded SQLite database.
+
+Run with `python -m benchmarks.micro [--save-baseline]`. Exits with 1 if a benchmark's
+median is slower than the stored baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+import orjson
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from benchmarks import stats
+from src.models.leave_requests import LeaveRequest, LeaveRequestStatus
+from src.models.users import User
+from src.services.leave_requests import LEAVE_REQUEST_COLUMNS, LeaveRequestService
+from src.services.users import UserService, principal_cache
+from src.utils import hasher, time_calc
+
+HISTORY_SIZE = 1_000
+ROWS = 1_000
+
+
+async def seed(session: AsyncSession) -> User:
+    """
+    Creates a user with `HISTORY_SIZE` past leave requests.
+    :param session: The session to seed with.
+    :return: The user.
+    """
+    user = User(
+        full_name="bench",
+        username="bench",
+        hashed_password=hasher.hash("password"),
+        remaining_leave_days=10,
+    )
+    session.add(user)
+    await session.commit()
+
+    day = datetime(2000, 1, 1)
+    session.add_all(
+        LeaveRequest(
+            requester_id=user.id,
+            reason="history",
+            status=LeaveRequestStatus.approved,
+            start_date=day + timedelta(days=i),
+            end_date=day + timedelta(days=i),
+        )
+        for i in range(HISTORY_SIZE)
+    )
+    await session.commit()
+    return user
+
+
+async def time_calls(fn: Callable[[], Awaitable[object]], repeat: int) -> List[float]:
+    """
+    Times calls to a function one by one, after a warm-up call.
+    :param fn: The function to call.
+    :param repeat: The number of timed calls.
+    :return: The duration of each call, in seconds.
+    """
+    await fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def run(repeat: int) -> Dict[str, stats.Summary]:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/bench.db")
+        async with engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            user = await seed(session)
+            leave_requests = LeaveRequestService(session)
+            users = UserService(session)
+            start_date = datetime.now() + timedelta(days=7)
+            leave_request = LeaveRequest(
+                requester_id=user.id,
+                reason="bench",
+                start_date=start_date,
+                end_date=start_date + timedelta(days=4),
+            )
+            rows = (
+                await session.exec(select(*LEAVE_REQUEST_COLUMNS).limit(ROWS))
+            ).all()
+            starts = [start_date + timedelta(days=i % 300) for i in range(10_000)]
+            ends = [day + timedelta(days=9) for day in starts]
+
+            async def get_principal() -> None:
+                principal_cache.clear()
+                await users.get_principal(user.id)
+
+            async def get_cached_principal() -> None:
+                await users.get_principal(user.id)
+
+            async def serialize_rows() -> None:
+                orjson.dumps([row._asdict() for row in rows])
+
+            async def count_business_days() -> None:
+                time_calc.business_days_between_many(starts, ends)
+
+            async def hash_password() -> None:
+                hasher.hash("password")
+
+            async def verify_password() -> None:
+                hasher.verify("password", user.hashed_password)
+
+            cases: Dict[str, Callable[[], Awaitable[object]]] = {
+                "leave_request_allowed": lambda: leave_requests.leave_request_allowed(
+                    leave_request, user
+                ),
+                "get_user_by_user_id": lambda: users.get_user_by_user_id(user.id),
+                "get_user_by_username": lambda: users.get_user_by_username("bench"),
+                "get_principal (miss)": get_principal,
+                "get_principal (hit)": get_cached_principal,
+                f"serialize {ROWS} rows": serialize_rows,
+                "business days of 10k ranges": count_business_days,
+            }
+            results = {
+                name: stats.summarize(await time_calls(fn, repeat))
+                for name, fn in cases.items()
+            }
+            # bcrypt is slow on purpose, a few calls are enough.
+            for name, fn in (
+                ("hasher.hash", hash_password),
+                ("hasher.verify", verify_password),
+            ):
+                results[name] = stats.summarize(await time_calls(fn, 5))
+
+        await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro")
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store this run as the baseline."
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeat))
+    regressions = stats.report(
+        results, stats.load_baseline("micro"), "p50", args.tolerance
+    )
+    if args.save_baseline:
+        stats.save_baseline("micro", results)
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Summaries of latency samples and their comparison against a stored baseline, shared by
+the benchmarks.
+"""
+import json
+import statistics
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASELINES = Path(__file__).resolve().parent / "baselines"
+
+Summary = Dict[str, float]
+
+
+def summarize(samples: List[float], seconds: Optional[float] = None) -> Summary:
+    """
+    Summarizes latency samples.
+    :param samples: The latencies, in seconds.
+    :param seconds: The wall time the samples were collected over, to report their
+    throughput.
+    :return: The count, mean and percentiles in milliseconds, and the throughput per
+    second if `seconds` was given.
+    """
+    if len(samples) > 1:
+        percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+    else:
+        percentiles = samples * 99
+    summary = {
+        "count": len(samples),
+        "mean": statistics.fmean(samples) * 1e3,
+        "p50": percentiles[49] * 1e3,
+        "p95": percentiles[94] * 1e3,
+        "p99": percentiles[98] * 1e3,
+    }
+    if seconds:
+        summary["per_second"] = len(samples) / seconds
+    return summary
+
+
+def load_baseline(name: str) -> Dict[str, Summary]:
+    """
+    Reads a stored baseline.
+    :param name: The name of the benchmark.
+    :return: The summaries of the baseline run, empty if there is none.
+    """
+    path = BASELINES / f"{name}.json"
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(name: str, results: Dict[str, Summary]) -> None:
+    """
+    Stores the results of a run as the new baseline.
+    :param name: The name of the benchmark.
+    :param results: The summaries to store.
+    """
+    BASELINES.mkdir(exist_ok=True)
+    path = BASELINES / f"{name}.json"
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+
+def report(
+    results: Dict[str, Summary],
+    baseline: Dict[str, Summary],
+    metric: str,
+    tolerance: float,
+) -> List[str]:
+    """
+    Prints the results next to the baseline.
+    :param results: The summaries of this run.
+    :param baseline: The summaries of the baseline run.
+    :param metric: The summary field compared with the baseline, e.g. `"p95"`.
+    :param tolerance: How much slower than the baseline counts as a regression, e.g.
+    0.2 for 20%.
+    :return: The names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(
+        f"{'benchmark':<32}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'per s':>10}{'vs base':>10}"
+    )
+    for name, summary in results.items():
+        change = ""
+        if name in baseline and baseline[name][metric]:
+            ratio = summary[metric] / baseline[name][metric]
+            change = f"{ratio - 1:+.0%}"
+            if ratio > 1 + tolerance:
+                regressions.append(name)
+                change += " !"
+        per_second = summary.get("per_second")
+        throughput = f"{per_second:.1f}" if per_second else ""
+        print(
+            f"{name:<32}{summary['count']:>8}{summary['p50']:>10.2f}"
+            f"{summary['p95']:>10.2f}{summary['p99']:>10.2f}{throughput:>10}{change:>10}"
+        )
+    if regressions:
+        print(f"{metric} regressed more than {tolerance:.0%}: {', '.join(regressions)}")
+    return regressions
@@ -1,10 +1,25 @@
+import math
 import os
+import time
+from pathlib import Path
+from typing import AsyncIterator
 
+from alembic import command
+from alembic.config import Config
 from dotenv import load_dotenv
-from sqlmodel import Session, SQLModel, create_engine, select
+from fastapi import Depends, Request, Response
+from sqlalchemy import Connection, inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+# Every model is imported so SQLModel.metadata knows all tables, for the migrations.
+import src.models.idempotency_keys  # noqa: F401
+import src.models.leave_request_counts  # noqa: F401
+from src.models import jobs, leave_requests, versions  # noqa: F401
 from src.models.users import User
-from src.utils import hasher
+from src.utils import hasher, pools
+from src.utils.cache import TTLCache
 
 load_dotenv()
 
@@ -14,29 +29,204 @@ DB_HOST = os.environ.get("DB_HOST", "localhost")
 DB_PORT = os.environ.get("DB_PORT", 5432)
 DB_NAME = os.environ.get("DB_NAME", "postgres")
 
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "bigchungus")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+# The revision matching the schema `create_all` made before there were migrations.
+INITIAL_REVISION = "0001"
+# The Postgres advisory lock taken while migrating.
+MIGRATION_LOCK_ID = 2_024_001
+
+# Read-only traffic goes to the replica when one is configured.
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.environ.get("DB_REPLICA_PORT", DB_PORT)
+# How many seconds a client's reads stay on the primary after it writes, so it reads
+# its own writes despite replication lag.
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+
+# For the event broker's asyncpg connection and offline migrations.
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+ASYNC_REPLICA_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}"
+    f"@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+    if DB_REPLICA_HOST
+    else None
+)
+
+# Pool settings apply per engine and per worker process.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+
+POOL_SETTINGS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=pools.InstrumentedAsyncAdaptedQueuePool,
+    **POOL_SETTINGS,
+)
+replica_async_engine = (
+    create_async_engine(
+        ASYNC_REPLICA_DATABASE_URL,
+        poolclass=pools.InstrumentedAsyncAdaptedQueuePool,
+        **POOL_SETTINGS,
+    )
+    if ASYNC_REPLICA_DATABASE_URL
+    else async_engine
+)
 
-engine = create_engine(DATABASE_URL)
+# The cookie telling every worker when the client last wrote, in epoch seconds.
+LAST_WRITE_COOKIE = "last_write"
+# Clients (keyed by their `Authorization` header) that recently made a write through
+# this worker, for clients that don't keep cookies.
+recent_writers: TTLCache[bool] = TTLCache(10_000, READ_YOUR_WRITES_SECONDS)
 
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+def run_migrations(connection: Connection) -> None:
+    """
+    Upgrades the schema to the latest migration. A database created by `create_all`
+    before there were migrations is first stamped with the initial revision.
+    :param connection: The connection to migrate with, inside a transaction.
+    """
+    if connection.dialect.name == "postgresql":
+        # Held until the transaction ends, so workers starting together take turns.
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+        )
 
-    with Session(engine) as session:
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    config.attributes["connection"] = connection
+    inspector = inspect(connection)
+    if inspector.has_table("user") and not inspector.has_table("alembic_version"):
+        # Tables added to the models after the database was created.
+        SQLModel.metadata.create_all(
+            connection, tables=[jobs.JobRun.__table__, versions.ChangeVersion.__table__]
+        )
+        command.stamp(config, INITIAL_REVISION)
+    command.upgrade(config, "head")
+
+
+async def migrate(engine: AsyncEngine) -> None:
+    """
+    Upgrades the schema of a database to the latest migration.
+    :param engine: The engine of the database.
+    """
+    async with engine.begin() as connection:
+        await connection.run_sync(run_migrations)
+
+
+async def init_db() -> None:
+    """
+    Migrates the database schema and creates the admin user, if it doesn't exist yet.
+    """
+    await migrate(async_engine)
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         query = select(User).where(User.username == "admin")
-        result = session.exec(query).one_or_none()
+        result = (await session.exec(query)).one_or_none()
 
         if result is None:
             admin = User(
                 username="admin",
-                hashed_password=hasher.hash("bigchungus"),
+                hashed_password=await hasher.hash_async(ADMIN_PASSWORD),
                 full_name="Admin Istrator",
                 is_admin=True,
             )
             session.add(admin)
-            session.commit()
+            await session.commit()
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
 
 
-def get_session():
-    with Session(engine) as session:
+async def get_replica_session() -> AsyncIterator[AsyncSession]:
+    async with AsyncSession(replica_async_engine, expire_on_commit=False) as session:
         yield session
+
+
+async def get_read_session(
+    request: Request,
+    primary_session: AsyncSession = Depends(get_session),
+    replica_session: AsyncSession = Depends(get_replica_session),
+) -> AsyncSession:
+    """
+    Provides a session for read-only work. It is bound to the replica, unless the
+    client wrote something recently, then it is bound to the primary so the client
+    reads its own writes.
+    """
+    if wrote_recently(request):
+        return primary_session
+    return replica_session
+
+
+def wrote_recently(request: Request) -> bool:
+    """
+    Checks if the client wrote in the last `READ_YOUR_WRITES_SECONDS`, through any
+    worker if it sent back the `last_write` cookie, or through this one otherwise.
+    :param request: The request to check.
+    :return: True if the client's reads should go to the primary.
+    """
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, "nan"))
+    except ValueError:
+        last_write = math.nan
+    if 0 <= time.time() - last_write < READ_YOUR_WRITES_SECONDS:
+        return True
+    client = request.headers.get("Authorization")
+    return client is not None and bool(recent_writers.get(client))
+
+
+def mark_recent_write(request: Request, response: Response) -> None:
+    """
+    Routes the client's reads to the primary for the next `READ_YOUR_WRITES_SECONDS`.
+    :param request: A request that wrote to the primary.
+    :param response: The response to the request, which gets the `last_write`
+    cookie.
+    """
+    response.set_cookie(
+        LAST_WRITE_COOKIE,
+        f"{time.time():.3f}",
+        max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+        httponly=True,
+        samesite="lax",
+    )
+    client = request.headers.get("Authorization")
+    if client is not None:
+        recent_writers.set(client, True)
+
+
+def reset_engines_after_fork() -> None:
+    """
+    Gives a forked worker process its own connection pools. Connections opened by the
+    parent are left to the parent instead of being shared with, or closed by, the child.
+    """
+    async_engine.sync_engine.dispose(close=False)
+    if replica_async_engine is not async_engine:
+        replica_async_engine.sync_engine.dispose(close=False)
+
+
+def get_pool_status() -> dict:
+    """
+    Describes the connection pools of this worker.
+    :return: The status of each engine's pool, see `pools.pool_status`.
+    """
+    result = {
+        "async_engine": pools.pool_status(async_engine.pool),
+    }
+    if replica_async_engine is not async_engine:
+        result["replica_async_engine"] = pools.pool_status(replica_async_engine.pool)
+    return result
@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import src.database as database
+from src.jobs import leave_reset
+
+
+async def run_reset_annual_leave(args: argparse.Namespace) -> None:
+    async with AsyncSession(database.async_engine, expire_on_commit=False) as session:
+        ran = await leave_reset.reset_annual_leave(
+            session,
+            quota=args.quota,
+            max_carry_over=args.max_carry_over,
+            force=args.force,
+        )
+    await database.async_engine.dispose()
+    print("Annual leave reset." if ran else "Annual leave was already reset this year.")
+
+
+async def run_init_db(args: argparse.Namespace) -> None:
+    await database.init_db()
+    await database.async_engine.dispose()
+    print("Database initialized.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.jobs")
+    subparsers = parser.add_subparsers(required=True)
+
+    reset_parser = subparsers.add_parser(
+        leave_reset.JOB_NAME, help="Reset every user's remaining leave days."
+    )
+    reset_parser.add_argument(
+        "--quota", type=int, default=leave_reset.ANNUAL_LEAVE_QUOTA
+    )
+    reset_parser.add_argument(
+        "--max-carry-over", type=int, default=leave_reset.ANNUAL_LEAVE_MAX_CARRY_OVER
+    )
+    reset_parser.add_argument(
+        "--force", action="store_true", help="Reset even if already reset this year."
+    )
+    reset_parser.set_defaults(func=run_reset_annual_leave)
+
+    init_db_parser = subparsers.add_parser(
+        "init-db", help="Migrate the database schema and create the admin user."
+    )
+    init_db_parser.set_defaults(func=run_init_db)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
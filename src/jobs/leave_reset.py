@@ -0,0 +1,43 @@
+import os
+from datetime import date
+from typing import Optional
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.services.jobs import JobService
+from src.services.users import UserService
+
+JOB_NAME = "reset-annual-leave"
+ANNUAL_LEAVE_QUOTA = int(os.environ.get("ANNUAL_LEAVE_QUOTA", 10))
+ANNUAL_LEAVE_MAX_CARRY_OVER = int(os.environ.get("ANNUAL_LEAVE_MAX_CARRY_OVER", 0))
+
+
+async def reset_annual_leave(
+    session: AsyncSession,
+    today: Optional[date] = None,
+    quota: int = ANNUAL_LEAVE_QUOTA,
+    max_carry_over: int = ANNUAL_LEAVE_MAX_CARRY_OVER,
+    force: bool = False,
+    run_if_new: bool = True,
+) -> bool:
+    """
+    Resets every user's remaining leave days, once per calendar year.
+    :param session: The session to run the reset with.
+    :param today: The current date.
+    :param quota: The number of leave days each user gets.
+    :param max_carry_over: The maximum number of unused leave days kept.
+    :param force: Whether to reset even if this year was already reset.
+    :param run_if_new: Whether to reset if the job never ran before. If not, this year
+    is only recorded as reset.
+    :return: True if the reset ran, False otherwise.
+    """
+    today = today or date.today()
+
+    async def reset() -> None:
+        await UserService(session).reset_all_remaining_leave_days(
+            quota, max_carry_over=max_carry_over
+        )
+
+    return await JobService(session).run_once(
+        JOB_NAME, str(today.year), reset, force=force, run_if_new=run_if_new
+    )
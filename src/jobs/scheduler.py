@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScheduledJob:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float
+
+
+class Scheduler:
+    """
+    Runs jobs periodically on the event loop of the app. Jobs are expected to guard
+    themselves against running twice (see `JobService.run_once`), since every worker
+    runs its own scheduler.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: List[ScheduledJob] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(
+        self, name: str, func: Callable[[], Awaitable[None]], interval: float
+    ) -> None:
+        """
+        Registers a job.
+        :param name: The name of the job, used for logging.
+        :param func: The coroutine function to run.
+        :param interval: The number of seconds to wait between runs.
+        """
+        self.jobs.append(ScheduledJob(name=name, func=func, interval=interval))
+
+    def start(self) -> None:
+        """Starts running every registered job in the background."""
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._run(job), name=job.name))
+
+    async def stop(self) -> None:
+        """Cancels the running jobs and waits for them to finish."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _run(self, job: ScheduledJob) -> None:
+        while True:
+            try:
+                await job.func()
+            except Exception:
+                logger.exception("Scheduled job %s failed.", job.name)
+            await asyncio.sleep(job.interval)
@@ -1,9 +1,20 @@
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 import src.database as database
-from src.routers import leave_requests, users
+from src.jobs import leave_reset
+from src.jobs.scheduler import Scheduler
+from src.routers import internal, leave_requests, users
+from src.services import events, idempotency
+from src.utils import compression, hasher, metrics, query_budget
 
 tags_metadata = [
     {
@@ -14,15 +25,66 @@ tags_metadata = [
         "name": "leave_requests",
         "description": "Operations with leave requests, i.e, CRUD stuff.",
     },
+    {
+        "name": "internal",
+        "description": "Operational stats for sizing and monitoring workers.",
+    },
 ]
 
 origins = [
     "http://localhost:3000",
 ]
 
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+INIT_DB_ON_STARTUP = os.environ.get("INIT_DB_ON_STARTUP", "true").lower() == "true"
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_INTERVAL = float(os.environ.get("SCHEDULER_INTERVAL", 60 * 60))
+# Responses of at least this many bytes are gzipped for clients that accept it, except
+# event streams.
+GZIP_ENABLED = os.environ.get("GZIP_ENABLED", "true").lower() == "true"
+GZIP_MINIMUM_SIZE = int(os.environ.get("GZIP_MINIMUM_SIZE", 1024))
+
+
+async def reset_annual_leave() -> None:
+    # A fresh deployment only records the current year, so balances aren't wiped
+    # mid-year. Use the CLI to reset explicitly.
+    async with AsyncSession(database.async_engine, expire_on_commit=False) as session:
+        await leave_reset.reset_annual_leave(session, run_if_new=False)
+
+
+async def delete_expired_idempotency_keys() -> None:
+    async with AsyncSession(database.async_engine) as session:
+        await idempotency.IdempotencyService(session).delete_expired_responses()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if INIT_DB_ON_STARTUP:
+        await database.init_db()
+
+    scheduler = Scheduler()
+    if SCHEDULER_ENABLED:
+        scheduler.add_job(leave_reset.JOB_NAME, reset_annual_leave, SCHEDULER_INTERVAL)
+        if idempotency.IDEMPOTENCY_STORE == "database":
+            scheduler.add_job(
+                "delete-expired-idempotency-keys",
+                delete_expired_idempotency_keys,
+                SCHEDULER_INTERVAL,
+            )
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    await events.broker.close()
+    hasher.shutdown()
+    await database.async_engine.dispose()
+    await database.replica_async_engine.dispose()
+
 
-app = FastAPI(openapi_tags=tags_metadata)
-database.init_db()
+app = FastAPI(
+    openapi_tags=tags_metadata,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,10 +93,86 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if GZIP_ENABLED:
+    app.add_middleware(
+        compression.SelectiveGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE
+    )
 
 
 app.include_router(users.router)
 app.include_router(leave_requests.router)
+app.include_router(internal.router)
+
+
+@app.middleware("http")
+async def route_reads_after_writes(request: Request, call_next: Callable) -> Response:
+    response = await call_next(request)
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        database.mark_recent_write(request, response)
+    return response
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next: Callable) -> Response:
+    stats = metrics.start_request()
+    started = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.labels(request.method).inc()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        _record_request(request, status.HTTP_500_INTERNAL_SERVER_ERROR, started, stats)
+        raise
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.labels(request.method).dec()
+    # Streamed responses, like exports and event streams, keep querying while their
+    # body is sent, so the request is recorded and its budget checked once it has
+    # been.
+    response.body_iterator = _record_request_after(
+        response.body_iterator, request, response.status_code, started, stats
+    )
+    return response
+
+
+async def _record_request_after(
+    body: AsyncIterator[bytes],
+    request: Request,
+    status_code: int,
+    started: float,
+    stats: metrics.RequestStats,
+) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        _record_request(request, status_code, started, stats)
+        query_budget.check_query_budget(
+            request.method, request.scope.get("route"), stats
+        )
+
+
+def _record_request(
+    request: Request, status_code: int, started: float, stats: metrics.RequestStats
+) -> None:
+    # The path template, so ids in the path don't create new series.
+    route = request.scope.get("route")
+    metrics.record_request(
+        request.method,
+        route.path if route is not None else "unmatched",
+        status_code,
+        time.perf_counter() - started,
+        stats,
+    )
+
+
+@app.exception_handler(hasher.HasherBusyError)
+async def hasher_busy_handler(
+    request: Request, exc: hasher.HasherBusyError
+) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please try again."},
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.get("/")
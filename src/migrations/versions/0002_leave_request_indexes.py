@@ -0,0 +1,55 @@
+"""Index leave requests by requester, by date and by status, and make usernames unique
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:30:00.000000
+
+Databases created by `create_all` since the first two indexes were added to the model
+already have them, hence `if_not_exists`. Making usernames unique fails if there are
+duplicate usernames already; they have to be resolved by hand first.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Overlap checks and a requester's own leave requests.
+    op.create_index(
+        "ix_leaverequest_requester_id_end_date_start_date",
+        "leaverequest",
+        ["requester_id", "end_date", "start_date"],
+        if_not_exists=True,
+    )
+    # The listing's keyset pagination, with and without a status filter.
+    op.create_index(
+        "ix_leaverequest_start_date_id",
+        "leaverequest",
+        ["start_date", "id"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_leaverequest_status_start_date_id",
+        "leaverequest",
+        ["status", "start_date", "id"],
+    )
+    # Login and registration look users up by username.
+    op.drop_index("ix_user_username", table_name="user")
+    op.create_index("ix_user_username", "user", ["username"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_username", table_name="user")
+    op.create_index("ix_user_username", "user", ["username"])
+    op.drop_index("ix_leaverequest_status_start_date_id", table_name="leaverequest")
+    op.drop_index("ix_leaverequest_start_date_id", table_name="leaverequest")
+    op.drop_index(
+        "ix_leaverequest_requester_id_end_date_start_date", table_name="leaverequest"
+    )
@@ -0,0 +1,50 @@
+"""Count leave requests per requester and status
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "leaverequestcount",
+        sa.Column("requester_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "status",
+            # The type was created with the leaverequest table.
+            postgresql.ENUM(
+                "pending",
+                "approved",
+                "denied",
+                name="leaverequeststatus",
+                create_type=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["requester_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("requester_id", "status"),
+    )
+    op.execute(
+        "INSERT INTO leaverequestcount (requester_id, status, count) "
+        "SELECT requester_id, status, COUNT(*) FROM leaverequest "
+        "WHERE requester_id IS NOT NULL AND status IS NOT NULL "
+        "GROUP BY requester_id, status"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("leaverequestcount")
@@ -0,0 +1,34 @@
+"""Store the leave days charged for each leave request
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("leaverequest", sa.Column("leave_days", sa.Integer(), nullable=True))
+    # Existing leave requests were charged calendar days, both ends included.
+    if op.get_bind().dialect.name == "postgresql":
+        days = "EXTRACT(DAY FROM end_date - start_date) + 1"
+    else:
+        days = "CAST(julianday(end_date) - julianday(start_date) AS INTEGER) + 1"
+    op.execute(f"UPDATE leaverequest SET leave_days = {days}")
+    with op.batch_alter_table("leaverequest") as batch_op:
+        batch_op.alter_column("leave_days", nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("leaverequest") as batch_op:
+        batch_op.drop_column("leave_days")
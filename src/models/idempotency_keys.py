@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class IdempotencyKey(SQLModel, table=True):
+    """
+    The stored response of a request made with an `Idempotency-Key` header, shared by
+    the workers so a retry landing on any of them gets the same response.
+    """
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    key: str = Field(primary_key=True)
+    fingerprint: str
+    resource_id: int
+    status_code: int
+    body: bytes
+    created_at: datetime = Field(index=True)
@@ -0,0 +1,9 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class JobRun(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    period: str
+    last_run_at: datetime
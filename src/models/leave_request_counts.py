@@ -0,0 +1,16 @@
+from sqlmodel import Column, Enum, Field, SQLModel
+
+from src.models.leave_requests import LeaveRequestStatus
+
+
+class LeaveRequestCount(SQLModel, table=True):
+    """
+    The number of leave requests of a requester with a status, kept up to date in the
+    same transactions that change the leave requests.
+    """
+
+    requester_id: int = Field(foreign_key="user.id", primary_key=True)
+    status: LeaveRequestStatus = Field(
+        sa_column=Column(Enum(LeaveRequestStatus), primary_key=True)
+    )
+    count: int = 0
@@ -2,7 +2,7 @@ import enum
 from datetime import datetime
 from typing import Optional
 
-from sqlmodel import Column, Enum, Field, SQLModel
+from sqlmodel import Column, Enum, Field, Index, SQLModel
 
 
 class LeaveRequestStatus(str, enum.Enum):
@@ -12,6 +12,18 @@ class LeaveRequestStatus(str, enum.Enum):
 
 
 class LeaveRequest(SQLModel, table=True):
+    # Indexes are added to existing databases by migrations in `src/migrations/`.
+    __table_args__ = (
+        Index("ix_leaverequest_start_date_id", "start_date", "id"),
+        Index("ix_leaverequest_status_start_date_id", "status", "start_date", "id"),
+        Index(
+            "ix_leaverequest_requester_id_end_date_start_date",
+            "requester_id",
+            "end_date",
+            "start_date",
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     requester_id: Optional[int] = Field(default=None, foreign_key="user.id")
     reason: str
@@ -20,3 +32,6 @@ class LeaveRequest(SQLModel, table=True):
     )
     start_date: datetime
     end_date: datetime
+    # The leave days deducted when the leave request was made, refunded if it is
+    # deleted, so later calendar changes don't change the refund.
+    leave_days: int = 0
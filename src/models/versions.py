@@ -0,0 +1,12 @@
+from sqlmodel import Field, SQLModel
+
+
+class ChangeVersion(SQLModel, table=True):
+    """
+    A counter of the changes made to a table, split in shards that writers bump
+    independently. The version of the table is the sum of its shards.
+    """
+
+    name: str = Field(primary_key=True)
+    shard: int = Field(default=0, primary_key=True)
+    version: int = 0
@@ -0,0 +1,31 @@
+import os
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from src.database import get_pool_status
+from src.models.users import User
+from src.routers.users import get_current_user
+from src.utils import metrics
+from src.utils.query_budget import query_budget
+
+router = APIRouter()
+
+
+@router.get("/internal/pool-stats", tags=["internal"])
+@query_budget(2)
+async def pool_stats(current_user: Annotated[User, Depends(get_current_user)]) -> dict:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sussy activity detected.",
+        )
+
+    return {"pid": os.getpid(), "pools": get_pool_status()}
+
+
+@router.get("/metrics", tags=["internal"], response_class=Response)
+@query_budget(0)
+async def get_metrics() -> Response:
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
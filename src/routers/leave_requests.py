@@ -1,17 +1,21 @@
-from typing import Annotated, List
+from datetime import date
+from typing import Annotated, AsyncIterator, List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.database import get_session
+import src.schemas.leave_requests as schemas
+from src.database import get_read_session, get_session
 from src.models.leave_requests import LeaveRequest, LeaveRequestStatus
 from src.models.users import User
 from src.routers.users import get_current_user
-from src.schemas.leave_requests import LeaveRequestCreate
+from src.services import events, idempotency
+from src.services.leave_request_counts import LeaveRequestCountService
 from src.services.leave_requests import LeaveRequestService
-from src.services.users import UserService
-from src.utils.time_calc import days_between
+from src.utils import etags, export, pagination
+from src.utils.query_budget import query_budget
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -20,76 +24,392 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 @router.post(
     "/api/create-leave-request",
     tags=["leave-requests"],
-    response_model=LeaveRequest,
+    response_model=schemas.LeaveRequestRead,
     status_code=status.HTTP_201_CREATED,
 )
+@query_budget(10)
 async def create_leave_request(
-    leave_request_info: LeaveRequestCreate,
+    leave_request_info: schemas.LeaveRequestCreate,
     current_user: Annotated[User, Depends(get_current_user)],
-    session: Session = Depends(get_session),
-) -> LeaveRequest:
+    session: AsyncSession = Depends(get_session),
+    idempotency_key: Annotated[
+        Optional[str], Header(min_length=1, max_length=255)
+    ] = None,
+) -> Union[LeaveRequest, Response]:
+    if idempotency_key is None:
+        leave_request = await _create_leave_request(
+            leave_request_info, current_user, session
+        )
+    else:
+        leave_request = await _create_idempotent_leave_request(
+            leave_request_info, current_user, session, idempotency_key
+        )
+    if leave_request is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Leave request invalid.",
+        )
+
+    return leave_request
+
+
+async def _create_leave_request(
+    leave_request_info: schemas.LeaveRequestCreate,
+    current_user: User,
+    session: AsyncSession,
+    idempotent_request: Optional[idempotency.IdempotentRequest] = None,
+) -> Optional[LeaveRequest]:
     leave_request: LeaveRequest = LeaveRequest(
-        requester_id=current_user.id,
-        requester=current_user,
-        **leave_request_info.model_dump()
+        requester_id=current_user.id, **leave_request_info.model_dump()
     )
-    can_request_leave: bool = LeaveRequestService(session).leave_request_allowed(
-        leave_request=leave_request
+    created: bool = await LeaveRequestService(session).create_leave_request(
+        leave_request=leave_request, idempotent_request=idempotent_request
     )
-    if not can_request_leave:
+
+    return leave_request if created else None
+
+
+async def _create_idempotent_leave_request(
+    leave_request_info: schemas.LeaveRequestCreate,
+    current_user: User,
+    session: AsyncSession,
+    idempotency_key: str,
+) -> Union[LeaveRequest, Response, None]:
+    # Retries of a request that went through get its response back, without creating
+    # the leave request or deducting its days again.
+    idempotent_request = idempotency.IdempotentRequest(
+        key=idempotency_key, fingerprint=idempotency.fingerprint(leave_request_info)
+    )
+    idempotency_service = idempotency.IdempotencyService(session)
+    stored = await idempotency_service.get_response(current_user.id, idempotency_key)
+    if stored is not None:
+        return _replay_response(stored, idempotent_request)
+
+    in_progress = False
+    try:
+        with idempotency.claim(current_user.id, idempotency_key):
+            leave_request = await _create_leave_request(
+                leave_request_info, current_user, session, idempotent_request
+            )
+        if leave_request is not None:
+            return leave_request
+    except idempotency.IdempotencyKeyInUse:
+        in_progress = True
+
+    # A concurrent retry may have gone through on another worker while this one
+    # waited for the requester's lock, and made this one overlap with it.
+    stored = await idempotency_service.get_response(current_user.id, idempotency_key)
+    if stored is not None:
+        return _replay_response(stored, idempotent_request)
+    if in_progress:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Leave request invalid.",
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is in progress.",
         )
+    return None
 
-    LeaveRequestService(session).create_leave_request(leave_request=leave_request)
 
-    days_requested: int = days_between(leave_request.start_date, leave_request.end_date)
-    UserService(session).deduct_remaining_leave_days(
-        username=current_user.username, days=days_requested
+def _replay_response(
+    stored: idempotency.StoredResponse,
+    idempotent_request: idempotency.IdempotentRequest,
+) -> Response:
+    if stored.fingerprint != idempotent_request.fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request.",
+        )
+    return Response(
+        content=stored.body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
     )
 
-    return LeaveRequestService(session).get_leave_request_by_id(leave_request.id)
+
+@router.post(
+    "/api/create-leave-requests",
+    tags=["leave-requests"],
+    response_model=List[schemas.LeaveRequestCreateResult],
+    status_code=status.HTTP_201_CREATED,
+)
+@query_budget(8)
+async def create_leave_requests(
+    batch: schemas.LeaveRequestBatchCreate,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: AsyncSession = Depends(get_session),
+) -> List[schemas.LeaveRequestCreateResult]:
+    leave_requests: List[LeaveRequest] = []
+    for item in batch.items:
+        requester_id = item.requester_id or current_user.id
+        if requester_id != current_user.id and not current_user.is_admin:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Sussy activity detected.",
+            )
+        leave_requests.append(
+            LeaveRequest(
+                requester_id=requester_id, **item.model_dump(exclude={"requester_id"})
+            )
+        )
+
+    return await LeaveRequestService(session).create_leave_requests(leave_requests)
 
 
-@router.get("/api/get-all-leave-requests", tags=["leave-requests"])
+@router.get(
+    "/api/get-all-leave-requests",
+    tags=["leave-requests"],
+    response_model=schemas.LeaveRequestPage,
+)
+@query_budget(4)
 async def get_all_leave_requests(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    filters: Annotated[schemas.LeaveRequestFilter, Depends()],
+    session: AsyncSession = Depends(get_read_session),
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)
+    ] = pagination.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Response:
+    try:
+        position: Optional[pagination.Cursor] = (
+            pagination.decode_cursor(cursor) if cursor else None
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor.",
+        )
+
+    leave_request_service = LeaveRequestService(session)
+    # Any change to the leave requests bumps the version, so a client holding the
+    # current ETag already has this exact page.
+    headers = {
+        "ETag": etags.make_etag(await leave_request_service.get_version()),
+        "Cache-Control": "no-cache",
+    }
+    if etags.etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    leave_requests, next_position = await leave_request_service.get_all_leave_requests(
+        filters=filters, limit=limit, cursor=position
+    )
+
+    next_cursor = pagination.encode_cursor(*next_position) if next_position else None
+    # The rows already have the shape of `LeaveRequestPage`, so they're serialized
+    # directly instead of being validated again against the response model.
+    return ORJSONResponse(
+        {"items": leave_requests, "next_cursor": next_cursor}, headers=headers
+    )
+
+
+@router.get(
+    "/api/get-pending-leave-requests",
+    tags=["leave-requests"],
+    response_model=schemas.LeaveRequestPage,
+)
+@query_budget(4)
+async def get_pending_leave_requests(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: AsyncSession = Depends(get_read_session),
+    limit: Annotated[
+        int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)
+    ] = pagination.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Response:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sussy activity detected.",
+        )
+    try:
+        position: Optional[pagination.Cursor] = (
+            pagination.decode_cursor(cursor) if cursor else None
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor.",
+        )
+
+    leave_request_service = LeaveRequestService(session)
+    headers = {
+        "ETag": etags.make_etag(await leave_request_service.get_version()),
+        "Cache-Control": "no-cache",
+    }
+    if etags.etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Served from the index on (status, start_date, id), oldest start first.
+    leave_requests, next_position = await leave_request_service.get_all_leave_requests(
+        filters=schemas.LeaveRequestFilter(status=LeaveRequestStatus.pending),
+        limit=limit,
+        cursor=position,
+    )
+
+    next_cursor = pagination.encode_cursor(*next_position) if next_position else None
+    return ORJSONResponse(
+        {"items": leave_requests, "next_cursor": next_cursor}, headers=headers
+    )
+
+
+@router.get(
+    "/api/get-leave-request-counts",
+    tags=["leave-requests"],
+    response_model=schemas.LeaveRequestCountSummary,
+)
+@query_budget(4)
+async def get_leave_request_counts(
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: AsyncSession = Depends(get_read_session),
+    requester_id: Optional[int] = None,
+    by_requester: bool = False,
+) -> schemas.LeaveRequestCountSummary:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sussy activity detected.",
+        )
+
+    count_service = LeaveRequestCountService(session)
+    summary = schemas.LeaveRequestCountSummary(
+        counts=await count_service.get_counts(requester_id)
+    )
+    if by_requester:
+        summary.requesters = [
+            schemas.LeaveRequestRequesterCounts(requester_id=id, counts=counts)
+            for id, counts in (
+                await count_service.get_counts_by_requester(requester_id)
+            ).items()
+        ]
+    return summary
+
+
+@router.get(
+    "/api/export-leave-requests",
+    tags=["leave-requests"],
+    response_class=StreamingResponse,
+)
+@query_budget(3)
+async def export_leave_requests(
     current_user: Annotated[User, Depends(get_current_user)],
-    session: Session = Depends(get_session),
-) -> List[LeaveRequest]:
-    leave_requests: List[LeaveRequest] = LeaveRequestService(
-        session
-    ).get_all_leave_requests()
-    return leave_requests
+    filters: Annotated[schemas.LeaveRequestFilter, Depends()],
+    session: AsyncSession = Depends(get_read_session),
+    format: schemas.LeaveRequestExportFormat = schemas.LeaveRequestExportFormat.csv,
+) -> StreamingResponse:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sussy activity detected.",
+        )
+
+    async def stream() -> AsyncIterator[Union[str, bytes]]:
+        # The session was closed when the dependencies exited, before the body is
+        # streamed. A closed session starts over on first use, so it is closed again
+        # here once the export is done.
+        try:
+            if format == schemas.LeaveRequestExportFormat.csv:
+                yield export.encode_csv_header(
+                    list(schemas.LeaveRequestRead.model_fields)
+                )
+            async for rows in LeaveRequestService(session).stream_leave_requests(
+                filters=filters
+            ):
+                if format == schemas.LeaveRequestExportFormat.csv:
+                    yield export.encode_csv_rows(rows)
+                else:
+                    yield export.encode_ndjson_rows(rows)
+        finally:
+            await session.close()
+
+    media_type = (
+        "text/csv"
+        if format == schemas.LeaveRequestExportFormat.csv
+        else "application/x-ndjson"
+    )
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="leave-requests.{format.value}"'
+        },
+    )
+
+
+@router.get(
+    "/api/get-leave-headcount",
+    tags=["leave-requests"],
+    response_model=List[schemas.LeaveHeadcountDay],
+)
+@query_budget(4)
+async def get_leave_headcount(
+    start_date: date,
+    end_date: date,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: AsyncSession = Depends(get_read_session),
+    leave_request_status: Annotated[
+        Optional[LeaveRequestStatus], Query(alias="status")
+    ] = None,
+    by_status: bool = False,
+) -> List[dict]:
+    if not 0 <= (end_date - start_date).days < schemas.MAX_HEADCOUNT_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid date range.",
+        )
+
+    # Denied leave requests don't take anyone off work.
+    statuses = (
+        [leave_request_status]
+        if leave_request_status is not None
+        else [LeaveRequestStatus.pending, LeaveRequestStatus.approved]
+    )
+    return await LeaveRequestService(session).get_headcount(
+        start_date, end_date, statuses, by_status=by_status
+    )
+
+
+@router.get(
+    "/api/leave-request-events",
+    tags=["leave-requests"],
+    response_class=StreamingResponse,
+)
+@query_budget(2)
+async def leave_request_events(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> StreamingResponse:
+    return StreamingResponse(
+        events.stream_leave_request_events(current_user),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Keeps proxies from buffering the stream.
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 @router.delete("/api/delete-leave-request/{leave_request_id}", tags=["leave-requests"])
+@query_budget(7)
 async def delete_leave_request(
     leave_request_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ) -> None:
-    leave_request: LeaveRequest = LeaveRequestService(session).get_leave_request_by_id(
-        leave_request_id
-    )
-    if leave_request.status != LeaveRequestStatus.pending:
+    if not await LeaveRequestService(session).delete_leave_request(leave_request_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot delete resolved leave request.",
         )
 
-    leave_days: int = days_between(leave_request.start_date, leave_request.end_date)
-    UserService(session).increment_remaining_leave_days(
-        current_user.username, leave_days
-    )
-    LeaveRequestService(session).delete_leave_request(leave_request_id)
-
 
 @router.put("/api/approve-leave-request/{leave_request_id}", tags=["leave-requests"])
+@query_budget(6)
 async def approve_leave_request(
     leave_request_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ) -> None:
     if not current_user.is_admin:
         raise HTTPException(
@@ -97,16 +417,17 @@ async def approve_leave_request(
             detail="Sussy activity detected.",
         )
 
-    LeaveRequestService(session).set_leave_request_status(
+    await LeaveRequestService(session).set_leave_request_status(
         leave_request_id, LeaveRequestStatus.approved
     )
 
 
 @router.put("/api/deny-leave-request/{leave_request_id}", tags=["leave-requests"])
+@query_budget(6)
 async def deny_leave_request(
     leave_request_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ) -> None:
     if not current_user.is_admin:
         raise HTTPException(
@@ -114,6 +435,37 @@ async def deny_leave_request(
             detail="Sussy activity detected.",
         )
 
-    LeaveRequestService(session).set_leave_request_status(
+    await LeaveRequestService(session).set_leave_request_status(
         leave_request_id, LeaveRequestStatus.denied
     )
+
+
+@router.put(
+    "/api/set-leave-request-statuses",
+    tags=["leave-requests"],
+    response_model=List[schemas.LeaveRequestStatusResult],
+)
+@query_budget(5)
+async def set_leave_request_statuses(
+    status_update: schemas.LeaveRequestStatusUpdate,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: AsyncSession = Depends(get_session),
+) -> List[schemas.LeaveRequestStatusResult]:
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sussy activity detected.",
+        )
+    if status_update.status == LeaveRequestStatus.pending:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Leave requests can only be approved or denied.",
+        )
+
+    outcomes = await LeaveRequestService(session).set_leave_request_statuses(
+        status_update.ids, status_update.status
+    )
+    return [
+        schemas.LeaveRequestStatusResult(id=id, outcome=outcome)
+        for id, outcome in outcomes.items()
+    ]
@@ -2,24 +2,40 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlmodel import Session
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.database import get_session
+from src.database import get_read_session, get_session
 from src.models.users import User
 from src.schemas.users import UserCreate
 from src.services.users import UserService
-from src.utils import hasher
+from src.utils import hasher, tokens
+from src.utils.query_budget import query_budget
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 @router.get("/api/get-current-user", response_model=User, tags=["users"])
+@query_budget(2)
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
+    read_session: AsyncSession = Depends(get_read_session),
 ) -> User:
-    user = UserService(session).get_user_by_username(username=token)
+    try:
+        payload = tokens.decode_access_token(token)
+    except tokens.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    user = await UserService(read_session).get_principal(payload.user_id)
+    if not user and read_session is not session:
+        # The user may be too new to have reached the replica.
+        user = await UserService(session).get_principal(payload.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -35,11 +51,12 @@ async def get_current_user(
     status_code=status.HTTP_201_CREATED,
     response_model=User,
 )
+@query_budget(3)
 async def register(
-    user_info: UserCreate, session: Session = Depends(get_session)
+    user_info: UserCreate, session: AsyncSession = Depends(get_session)
 ) -> User:
     if (
-        UserService(session).get_user_by_username(username=user_info.username)
+        await UserService(session).get_user_by_username(username=user_info.username)
         is not None
     ):
         raise HTTPException(
@@ -49,23 +66,35 @@ async def register(
     user: User = User(
         username=user_info.username,
         full_name=user_info.full_name,
-        hashed_password=hasher.hash(user_info.password),
+        hashed_password=await hasher.hash_async(user_info.password),
     )
-    user = UserService(session).create_user(user=user)
+    try:
+        user = await UserService(session).create_user(user=user)
+    except IntegrityError:
+        # Registered concurrently since the check above, caught by the unique index.
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Username already taken."
+        )
 
     return user
 
 
 @router.post("/token", tags=["users"], status_code=status.HTTP_200_OK)
+@query_budget(1)
 async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ) -> dict:
-    user: User = UserService(session).get_user_by_username(username=form_data.username)
-    if not user or not hasher.verify(form_data.password, user.hashed_password):
+    user: User = await UserService(session).get_user_by_username(
+        username=form_data.username
+    )
+    if not user or not await hasher.verify_async(
+        form_data.password, user.hashed_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password.",
         )
 
-    return {"access_token": user.username, "token_type": "bearer"}
+    access_token = tokens.create_access_token(user.id, user.is_admin)
+    return {"access_token": access_token, "token_type": "bearer"}
@@ -1,9 +1,113 @@
-from datetime import datetime
+import enum
+from datetime import date, datetime
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+
+from src.models.leave_requests import LeaveRequestStatus
+
+MAX_BATCH_SIZE = 500
+MAX_HEADCOUNT_DAYS = 366
 
 
 class LeaveRequestCreate(BaseModel):
     start_date: datetime
     end_date: datetime
     reason: str
+
+    @model_validator(mode="after")
+    def check_date_range(self) -> "LeaveRequestCreate":
+        # A reversed range counts negative days, which would add to the balance.
+        if self.end_date < self.start_date:
+            raise ValueError("end_date must not be before start_date")
+        return self
+
+
+class LeaveRequestBatchItem(LeaveRequestCreate):
+    requester_id: Optional[int] = None
+
+
+class LeaveRequestBatchCreate(BaseModel):
+    items: List[LeaveRequestBatchItem] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class LeaveRequestFilter(BaseModel):
+    status: Optional[LeaveRequestStatus] = None
+    requester_id: Optional[int] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+
+class LeaveRequestExportFormat(str, enum.Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+class LeaveRequestRead(BaseModel):
+    id: int
+    requester_id: Optional[int]
+    reason: str
+    status: LeaveRequestStatus
+    start_date: datetime
+    end_date: datetime
+
+
+class LeaveRequestPage(BaseModel):
+    items: List[LeaveRequestRead]
+    next_cursor: Optional[str] = None
+
+
+class LeaveRequestStatusUpdate(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+    status: LeaveRequestStatus
+
+
+class LeaveRequestStatusOutcome(str, enum.Enum):
+    updated = "updated"
+    already_resolved = "already_resolved"
+    missing = "missing"
+
+
+class LeaveRequestStatusResult(BaseModel):
+    id: int
+    outcome: LeaveRequestStatusOutcome
+
+
+class LeaveRequestCreateResult(BaseModel):
+    leave_request: Optional[LeaveRequestRead] = None
+    detail: Optional[str] = None
+
+
+class LeaveRequestEventType(str, enum.Enum):
+    created = "created"
+    updated = "updated"
+    deleted = "deleted"
+
+
+class LeaveRequestEventSubject(BaseModel):
+    id: int
+    requester_id: Optional[int]
+    status: LeaveRequestStatus
+
+
+class LeaveRequestEvent(BaseModel):
+    type: LeaveRequestEventType
+    # Only what identifies the change, clients fetch the rest. Keeps events small
+    # enough for a Postgres NOTIFY whatever the reason's length.
+    leave_request: LeaveRequestEventSubject
+
+
+class LeaveHeadcountDay(BaseModel):
+    date: date
+    count: int
+    statuses: Optional[Dict[LeaveRequestStatus, int]] = None
+
+
+class LeaveRequestRequesterCounts(BaseModel):
+    requester_id: int
+    counts: Dict[LeaveRequestStatus, int]
+
+
+class LeaveRequestCountSummary(BaseModel):
+    counts: Dict[LeaveRequestStatus, int]
+    requesters: Optional[List[LeaveRequestRequesterCounts]] = None
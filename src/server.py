@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import tempfile
+from typing import Any, Dict
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+logger = logging.getLogger(__name__)
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8000))
+# One worker per core, each with its own event loop and connection pools.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+# Importing the app once in the master lets workers share its memory and start faster,
+# but a graceful reload (SIGHUP) then doesn't pick up code changes.
+SERVER_PRELOAD = os.environ.get("SERVER_PRELOAD", "true").lower() == "true"
+SERVER_LOOP = os.environ.get("SERVER_LOOP", "auto")
+SERVER_HTTP = os.environ.get("SERVER_HTTP", "auto")
+SERVER_KEEPALIVE = int(os.environ.get("SERVER_KEEPALIVE", 5))
+SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", 2048))
+SERVER_TIMEOUT = int(os.environ.get("SERVER_TIMEOUT", 60))
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", 30))
+SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", 0))
+INIT_DB_ON_STARTUP = os.environ.get("INIT_DB_ON_STARTUP", "true").lower() == "true"
+
+LOOP_CHOICES = ("auto", "asyncio", "uvloop")
+HTTP_CHOICES = ("auto", "h11", "httptools")
+
+
+class Worker(UvicornWorker):
+    """A uvicorn worker whose event loop and HTTP parser are picked by the launcher."""
+
+    CONFIG_KWARGS = {"loop": SERVER_LOOP, "http": SERVER_HTTP}
+
+
+class Application(BaseApplication):
+    """Runs the app under a gunicorn master that supervises the uvicorn workers."""
+
+    def __init__(self, options: Dict[str, Any]) -> None:
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> Any:
+        from src.main import app
+
+        return app
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    import src.database as database
+
+    database.reset_engines_after_fork()
+
+
+def child_exit(server: Any, worker: Any) -> None:
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def build_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Translates the launcher's arguments into gunicorn settings.
+    :param args: The parsed command line arguments.
+    :return: The gunicorn settings.
+    """
+    # gunicorn imports the worker class by name, so it reads these back on import.
+    os.environ["SERVER_LOOP"] = args.loop
+    os.environ["SERVER_HTTP"] = args.http
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "src.server.Worker",
+        "preload_app": args.preload,
+        "keepalive": args.keepalive,
+        "backlog": args.backlog,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+    }
+
+
+def prepare_environment() -> None:
+    """
+    Does the per-deployment setup once in the master, so workers don't repeat it.
+    """
+    if "TOKEN_SECRET_KEY" not in os.environ:
+        # Workers must share the key, or a token from one is rejected by another.
+        logger.warning("TOKEN_SECRET_KEY is not set, tokens won't survive a restart.")
+        os.environ["TOKEN_SECRET_KEY"] = secrets.token_urlsafe(32)
+
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        # Lets every worker answer /metrics for all of them. Must be set before
+        # prometheus_client is imported.
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+
+    if INIT_DB_ON_STARTUP:
+        import src.database as database
+        from src.utils import hasher
+
+        async def init_db() -> None:
+            await database.init_db()
+            await database.async_engine.dispose()
+
+        asyncio.run(init_db())
+        # Threads don't survive a fork, so workers must start their own pool.
+        hasher.shutdown()
+        os.environ["INIT_DB_ON_STARTUP"] = "false"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument(
+        "--preload", action=argparse.BooleanOptionalAction, default=SERVER_PRELOAD
+    )
+    parser.add_argument("--loop", choices=LOOP_CHOICES, default=SERVER_LOOP)
+    parser.add_argument("--http", choices=HTTP_CHOICES, default=SERVER_HTTP)
+    parser.add_argument("--keepalive", type=int, default=SERVER_KEEPALIVE)
+    parser.add_argument("--backlog", type=int, default=SERVER_BACKLOG)
+    parser.add_argument("--timeout", type=int, default=SERVER_TIMEOUT)
+    parser.add_argument("--graceful-timeout", type=int, default=SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--max-requests", type=int, default=SERVER_MAX_REQUESTS)
+    args = parser.parse_args()
+
+    prepare_environment()
+    Application(build_options(args)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Iterable
+
+import orjson
+
+import src.schemas.leave_requests as schemas
+from src.database import DATABASE_URL
+from src.models.users import User
+from src.utils.broker import Broker, LocalBroker, PostgresBroker, SubscriptionClosed
+
+logger = logging.getLogger(__name__)
+
+# "local" only reaches clients connected to the same worker, use "postgres" to share
+# events between workers.
+EVENT_BROKER = os.environ.get("EVENT_BROKER", "local")
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 100))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", 15))
+
+LEAVE_REQUEST_CHANNEL = "leave_requests"
+
+broker: Broker = (
+    PostgresBroker(DATABASE_URL, EVENT_QUEUE_SIZE)
+    if EVENT_BROKER == "postgres"
+    else LocalBroker(EVENT_QUEUE_SIZE)
+)
+
+
+async def publish_leave_request_events(
+    events: Iterable[schemas.LeaveRequestEvent],
+) -> None:
+    """
+    Publishes leave request changes to the event stream. Called after the changes are
+    committed; a failure is logged rather than failing the request that made them.
+    :param events: The events to publish.
+    """
+    try:
+        await broker.publish_many(
+            LEAVE_REQUEST_CHANNEL, [event.model_dump(mode="json") for event in events]
+        )
+    except Exception:
+        logger.exception("Failed to publish leave request events.")
+
+
+async def stream_leave_request_events(user: User) -> AsyncIterator[str]:
+    """
+    Streams leave request events as Server-Sent Events until the client disconnects.
+    :param user: The user to stream for. Admins get every event, other users only
+    the events about their own leave requests.
+    :return: The SSE formatted messages, with a comment sent whenever nothing happened
+    for `EVENT_HEARTBEAT_SECONDS` so proxies keep the connection open. Ends when the
+    broker may have lost events.
+    """
+    async with broker.subscribe(LEAVE_REQUEST_CHANNEL) as subscription:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), EVENT_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            except SubscriptionClosed:
+                # Events may have been lost, the client reconnects after `retry` and
+                # should reload what it shows.
+                return
+
+            if user.is_admin or event["leave_request"]["requester_id"] == user.id:
+                data = orjson.dumps(event).decode("utf-8")
+                yield f"event: {event['type']}\ndata: {data}\n\n"
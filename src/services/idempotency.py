@@ -0,0 +1,156 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, NamedTuple, Optional, Set, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import delete, select
+
+from src.models.idempotency_keys import IdempotencyKey
+from src.services.base import BaseService
+from src.utils.cache import TTLCache
+
+# "memory" keeps the responses in each worker only, "database" also shares them
+# between workers through the idempotencykey table.
+IDEMPOTENCY_STORE = os.environ.get("IDEMPOTENCY_STORE", "memory")
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 10_000))
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", 24 * 60 * 60))
+
+
+class IdempotentRequest(NamedTuple):
+    key: str
+    fingerprint: str
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    resource_id: int
+    status_code: int
+    body: bytes
+
+
+class IdempotencyKeyInUse(Exception):
+    """Raised when another request with the same idempotency key got there first."""
+
+
+# Responses keyed by `(user_id, key)`. With the database store, a cache in front of
+# the shared table.
+response_cache: TTLCache[StoredResponse] = TTLCache(
+    IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL
+)
+# The keys of the requests this worker is handling right now.
+in_flight: Set[Tuple[int, str]] = set()
+
+
+def fingerprint(payload: BaseModel) -> str:
+    """
+    Hashes a request body, to tell a retry from a different request reusing its key.
+    :param payload: The parsed request body.
+    :return: The hex digest of the body.
+    """
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+@contextmanager
+def claim(user_id: int, key: str) -> Iterator[None]:
+    """
+    Marks an idempotency key as in use by this worker while handling its request.
+    :param user_id: The id of the user making the request.
+    :param key: The idempotency key of the request.
+    :raises IdempotencyKeyInUse: If this worker is already handling the key.
+    """
+    if (user_id, key) in in_flight:
+        raise IdempotencyKeyInUse(key)
+    in_flight.add((user_id, key))
+    try:
+        yield
+    finally:
+        in_flight.discard((user_id, key))
+
+
+class IdempotencyService(BaseService):
+    async def get_response(self, user_id: int, key: str) -> Optional[StoredResponse]:
+        """
+        Gets the stored response of an earlier request with an idempotency key.
+        :param user_id: The id of the user making the request.
+        :param key: The idempotency key of the request.
+        :return: The stored response or `None` if there is none or it expired.
+        """
+        response = response_cache.get((user_id, key))
+        if response is not None or IDEMPOTENCY_STORE != "database":
+            return response
+
+        query = select(
+            IdempotencyKey.fingerprint,
+            IdempotencyKey.resource_id,
+            IdempotencyKey.status_code,
+            IdempotencyKey.body,
+        ).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.created_at > _expired_before(),
+        )
+        row = (await self.session.exec(query)).one_or_none()
+        if row is None:
+            return None
+        response = StoredResponse(*row)
+        response_cache.set((user_id, key), response)
+        return response
+
+    async def save_response(
+        self, user_id: int, key: str, response: StoredResponse
+    ) -> None:
+        """
+        Stores the response of a request with an idempotency key in the current
+        transaction, without committing, so it is stored only if the request's changes
+        are. Call `cache_response` once committed.
+        :param user_id: The id of the user making the request.
+        :param key: The idempotency key of the request.
+        :param response: The response to replay to retries.
+        :raises IdempotencyKeyInUse: If a response is already stored for the key.
+        """
+        if IDEMPOTENCY_STORE != "database":
+            return
+
+        dialect = self.session.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        query = insert(IdempotencyKey).values(
+            user_id=user_id,
+            key=key,
+            created_at=datetime.now(),
+            **response._asdict(),
+        )
+        # Takes over expired keys, which may not have been deleted yet.
+        query = query.on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+            set_={
+                "created_at": query.excluded.created_at,
+                **{field: query.excluded[field] for field in response._fields},
+            },
+            where=IdempotencyKey.created_at <= _expired_before(),
+        ).returning(IdempotencyKey.key)
+        if (await self.session.exec(query)).one_or_none() is None:
+            raise IdempotencyKeyInUse(key)
+
+    def cache_response(self, user_id: int, key: str, response: StoredResponse) -> None:
+        """
+        Caches a committed response in this worker.
+        :param user_id: The id of the user that made the request.
+        :param key: The idempotency key of the request.
+        :param response: The response to replay to retries.
+        """
+        response_cache.set((user_id, key), response)
+
+    async def delete_expired_responses(self) -> None:
+        """Deletes the stored responses that can no longer be replayed."""
+        query = delete(IdempotencyKey).where(
+            IdempotencyKey.created_at <= _expired_before()
+        )
+        await self.session.exec(query)
+        await self.session.commit()
+
+
+def _expired_before() -> datetime:
+    return datetime.now() - timedelta(seconds=IDEMPOTENCY_TTL)
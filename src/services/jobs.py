@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from src.models.jobs import JobRun
+from src.services.base import BaseService
+
+
+class JobService(BaseService):
+    async def run_once(
+        self,
+        name: str,
+        period: str,
+        action: Callable[[], Awaitable[None]],
+        force: bool = False,
+        run_if_new: bool = True,
+    ) -> bool:
+        """
+        Runs a job's action at most once per period. The action and the job's run
+        record are committed together, so a restarted or concurrent worker can't apply
+        the same period twice.
+        :param name: The name of the job.
+        :param period: The period the run is for, e.g. the year.
+        :param action: Performs the job's writes in the current transaction without
+        committing.
+        :param force: Whether to run even if the period was already applied.
+        :param run_if_new: Whether to run the action the first time the job is seen.
+        If not, the current period is only recorded as applied.
+        :return: True if the action ran, False otherwise.
+        """
+        query = select(JobRun).where(JobRun.name == name).with_for_update()
+        job_run = (await self.session.exec(query)).one_or_none()
+        if job_run is not None and job_run.period == period and not force:
+            await self.session.rollback()
+            return False
+
+        ran = job_run is not None or run_if_new or force
+        if ran:
+            await action()
+        job_run = job_run or JobRun(name=name)
+        job_run.period = period
+        job_run.last_run_at = datetime.now()
+        self.session.add(job_run)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            # Another worker recorded the first ever run of this job concurrently.
+            await self.session.rollback()
+            return False
+
+        return ran
+
+    async def get_job_run(self, name: str) -> Optional[JobRun]:
+        """
+        Gets the last run of a job.
+        :param name: The name of the job.
+        :return: The `JobRun` of the job or `None` if it never ran.
+        """
+        query = select(JobRun).where(JobRun.name == name)
+        result = (await self.session.exec(query)).one_or_none()
+        return result
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from typing import Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+
+from src.models.leave_request_counts import LeaveRequestCount
+from src.models.leave_requests import LeaveRequestStatus
+from src.services.base import BaseService
+
+CountKey = Tuple[int, LeaveRequestStatus]
+
+
+class LeaveRequestCountService(BaseService):
+    async def adjust_counts(self, changes: Mapping[CountKey, int]) -> None:
+        """
+        Adds to the leave request counts in the current transaction, without
+        committing, so they change together with the leave requests.
+        :param changes: How much each `(requester_id, status)` count changes by.
+        """
+        # Sorted so concurrent transactions lock the rows in the same order.
+        rows = [
+            {"requester_id": requester_id, "status": status, "count": change}
+            for (requester_id, status), change in sorted(changes.items())
+            if change
+        ]
+        if not rows:
+            return
+
+        dialect = self.session.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        query = insert(LeaveRequestCount).values(rows)
+        query = query.on_conflict_do_update(
+            index_elements=[LeaveRequestCount.requester_id, LeaveRequestCount.status],
+            set_={"count": LeaveRequestCount.count + query.excluded["count"]},
+        )
+        await self.session.exec(query)
+
+    async def get_counts(
+        self, requester_id: Optional[int] = None
+    ) -> Dict[LeaveRequestStatus, int]:
+        """
+        Gets the number of leave requests with each status.
+        :param requester_id: Only count the leave requests of this user, if given.
+        :return: The count of each status, 0 for those without leave requests.
+        """
+        query = select(LeaveRequestCount.status, func.sum(LeaveRequestCount.count))
+        if requester_id is not None:
+            query = query.where(LeaveRequestCount.requester_id == requester_id)
+        query = query.group_by(LeaveRequestCount.status)
+
+        result = {status: 0 for status in LeaveRequestStatus}
+        for status, count in (await self.session.exec(query)).all():
+            result[status] = count
+        return result
+
+    async def get_counts_by_requester(
+        self, requester_id: Optional[int] = None
+    ) -> Dict[int, Dict[LeaveRequestStatus, int]]:
+        """
+        Gets the number of leave requests with each status, per requester.
+        :param requester_id: Only count the leave requests of this user, if given.
+        :return: The count of each status of each requester with leave requests,
+        ordered by requester id.
+        """
+        query = select(
+            LeaveRequestCount.requester_id,
+            LeaveRequestCount.status,
+            LeaveRequestCount.count,
+        ).where(LeaveRequestCount.count > 0)
+        if requester_id is not None:
+            query = query.where(LeaveRequestCount.requester_id == requester_id)
+        query = query.order_by(LeaveRequestCount.requester_id)
+
+        result: Dict[int, Dict[LeaveRequestStatus, int]] = defaultdict(
+            lambda: {status: 0 for status in LeaveRequestStatus}
+        )
+        for row_requester_id, status, count in (await self.session.exec(query)).all():
+            result[row_requester_id][status] = count
+        return dict(result)
@@ -1,133 +1,586 @@
-from datetime import datetime, timedelta
-from typing import List, Tuple
+import os
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from sqlmodel import select
+from sqlalchemy import Row, Select, and_, exists, or_
+from sqlmodel import delete, select, update
 
+import src.schemas.leave_requests as schemas
 from src.models.leave_requests import LeaveRequest, LeaveRequestStatus
 from src.models.users import User
+from src.services import events, idempotency
 from src.services.base import BaseService
+from src.services.leave_request_counts import LeaveRequestCountService
 from src.services.users import UserService
-from src.utils.time_calc import days_between
+from src.services.versions import VersionService
+from src.utils import time_calc
+from src.utils.cache import TTLCache
+from src.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, Cursor
+
+LEAVE_REQUEST_COLUMNS = (
+    LeaveRequest.id,
+    LeaveRequest.requester_id,
+    LeaveRequest.reason,
+    LeaveRequest.status,
+    LeaveRequest.start_date,
+    LeaveRequest.end_date,
+)
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+HEADCOUNT_CACHE_SIZE = int(os.environ.get("HEADCOUNT_CACHE_SIZE", 256))
+HEADCOUNT_CACHE_TTL = float(os.environ.get("HEADCOUNT_CACHE_TTL", 10 * 60))
+
+# Headcounts keyed by the leave requests' change version and the query, so any change
+# to the leave requests makes the cached entries unreachable.
+headcount_cache: TTLCache[List[Dict[str, Any]]] = TTLCache(
+    HEADCOUNT_CACHE_SIZE, HEADCOUNT_CACHE_TTL
+)
 
 
 class LeaveRequestService(BaseService):
-    def create_leave_request(self, leave_request: LeaveRequest) -> None:
+    async def create_leave_request(
+        self,
+        leave_request: LeaveRequest,
+        idempotent_request: Optional[idempotency.IdempotentRequest] = None,
+    ) -> bool:
         """
-        Inserts a new leave request into the database.
-        :param leave_request: The leave request object containing the user information.
+        Validates and inserts a new leave request, deducting the requested days from
+        the requester's remaining leave days, in a single transaction. The requester's
+        row stays locked until commit so concurrent submissions can't overdraw it.
+        :param leave_request: The leave request to insert.
+        :param idempotent_request: The idempotency key of the request, if given. The
+        response is stored for retries in the same transaction.
+        :return: True if the leave request was inserted, False if it isn't allowed.
+        :raises IdempotencyKeyInUse: If a response is already stored for the key.
         """
-        self.session.add(leave_request)
-        self.session.commit()
+        user_service = UserService(self.session)
+        requester: Optional[User] = await user_service.get_user_by_user_id(
+            leave_request.requester_id, for_update=True
+        )
+        if requester is None or not await self.leave_request_allowed(
+            leave_request, requester
+        ):
+            await self.session.rollback()
+            return False
 
-    def get_leave_requests_by_requester_id(
-        self, requester_id: int
-    ) -> List[LeaveRequest]:
-        """
-        Gets all leave requests for user with the given id.
-        :param requester_id: The id of the user to get the leave requests for.
-        :return: A list of leave requests for the given id.
-        """
-        query = select(LeaveRequest).where(LeaveRequest.requester_id == requester_id)
-        result: List[LeaveRequest] = self.session.exec(query).all()
+        leave_request.leave_days = time_calc.business_days_between(
+            leave_request.start_date, leave_request.end_date
+        )
+        self.session.add(leave_request)
+        await user_service.adjust_remaining_leave_days(
+            requester.id, -leave_request.leave_days
+        )
+        await LeaveRequestCountService(self.session).adjust_counts(
+            {(requester.id, LeaveRequestStatus.pending): 1}
+        )
+        if idempotent_request is not None:
+            idempotency_service = idempotency.IdempotencyService(self.session)
+            await self.session.flush()
+            body = schemas.LeaveRequestRead.model_validate(
+                leave_request, from_attributes=True
+            ).model_dump_json()
+            response = idempotency.StoredResponse(
+                fingerprint=idempotent_request.fingerprint,
+                resource_id=leave_request.id,
+                status_code=201,
+                body=body.encode(),
+            )
+            try:
+                await idempotency_service.save_response(
+                    requester.id, idempotent_request.key, response
+                )
+            except idempotency.IdempotencyKeyInUse:
+                await self.session.rollback()
+                raise
+        await self.record_change([requester.id])
+        await self.session.commit()
+        if idempotent_request is not None:
+            idempotency_service.cache_response(
+                requester.id, idempotent_request.key, response
+            )
+        await events.publish_leave_request_events(
+            [_event(schemas.LeaveRequestEventType.created, leave_request)]
+        )
 
-        return result
+        return True
 
-    def get_leave_request_by_id(self, id: int) -> LeaveRequest:
+    async def get_leave_request_by_id(
+        self, id: int, for_update: bool = False
+    ) -> LeaveRequest:
         """
         Gets a leave request with the given id.
         :param id: The id of the leave request to query.
+        :param for_update: Whether to lock the leave request's row (`SELECT ... FOR
+        UPDATE`) until the current transaction ends, reading its latest version.
         :return: The leave request with given id.
         """
         query = select(LeaveRequest).where(LeaveRequest.id == id)
-        result: LeaveRequest = self.session.exec(query).one()
+        if for_update:
+            query = query.with_for_update().execution_options(populate_existing=True)
+        result: LeaveRequest = (await self.session.exec(query)).one()
 
         return result
 
-    def get_all_leave_requests(self) -> List[LeaveRequest]:
+    async def get_all_leave_requests(
+        self,
+        filters: Optional[schemas.LeaveRequestFilter] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[Cursor] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Cursor]]:
+        """
+        Fetches a page of leave requests using keyset pagination on `(start_date, id)`.
+        Rows are returned as plain dicts with the fields of `LeaveRequestRead`, so
+        large pages skip building and validating a model per row.
+        :param filters: Optional status, requester and date window filters.
+        :param limit: The maximum number of leave requests to return.
+        :param cursor: The `(start_date, id)` of the last row of the previous page.
+        :return: The leave requests ordered by start date, and the cursor of the next
+        page or `None` if this is the last page.
+        """
+        limit = min(limit, MAX_PAGE_SIZE)
+        query = select(*LEAVE_REQUEST_COLUMNS)
+        query = self._apply_filters(query, filters)
+        if cursor is not None:
+            cursor_start_date, cursor_id = cursor
+            query = query.where(
+                or_(
+                    LeaveRequest.start_date > cursor_start_date,
+                    and_(
+                        LeaveRequest.start_date == cursor_start_date,
+                        LeaveRequest.id > cursor_id,
+                    ),
+                )
+            )
+        query = query.order_by(LeaveRequest.start_date, LeaveRequest.id).limit(
+            limit + 1
+        )
+
+        rows = (await self.session.exec(query)).all()
+        result: List[Dict[str, Any]] = [row._asdict() for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = result[-1]
+            next_cursor = (last["start_date"], last["id"])
+
+        return result, next_cursor
+
+    async def stream_leave_requests(
+        self,
+        filters: Optional[schemas.LeaveRequestFilter] = None,
+        batch_size: int = EXPORT_BATCH_SIZE,
+    ) -> AsyncIterator[Sequence[Row]]:
         """
-        Fetches all leave requests created.
-        :return: A list of all leave requests ordered by start date.
+        Streams every leave request matching the filters through a server-side cursor,
+        so only one batch of rows is held in memory at a time.
+        :param filters: Optional status, requester and date window filters.
+        :param batch_size: The number of rows fetched from the cursor at a time.
+        :return: Batches of rows with the fields of `LeaveRequestRead`, ordered by id.
         """
-        query = select(LeaveRequest)
-        result: List[LeaveRequest] = self.session.exec(query).all()
+        query = self._apply_filters(select(*LEAVE_REQUEST_COLUMNS), filters)
+        query = query.order_by(LeaveRequest.id).execution_options(yield_per=batch_size)
+        result = await self.session.stream(query)
+        async for rows in result.partitions():
+            yield rows
 
+    async def get_headcount(
+        self,
+        start_date: date,
+        end_date: date,
+        statuses: List[LeaveRequestStatus],
+        by_status: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Counts the leave requests covering each day of a date window.
+        :param start_date: The first day of the window.
+        :param end_date: The last day of the window, inclusive.
+        :param statuses: The statuses of the leave requests to count.
+        :param by_status: Whether to also break each day's count down by status.
+        :return: For each day, its date, count and, if asked, count per status, as
+        dicts with the fields of `LeaveHeadcountDay`.
+        """
+        key = (await self.get_version(), start_date, end_date, *statuses, by_status)
+        result = headcount_cache.get(key)
+        if result is not None:
+            return result
+
+        query = select(
+            LeaveRequest.status, LeaveRequest.start_date, LeaveRequest.end_date
+        ).where(
+            LeaveRequest.status.in_(statuses),
+            LeaveRequest.end_date >= datetime.combine(start_date, time.min),
+            LeaveRequest.start_date <= datetime.combine(end_date, time.max),
+        )
+        ranges: Dict[LeaveRequestStatus, Tuple[List[date], List[date]]] = {
+            status: ([], []) for status in statuses
+        }
+        for status, request_start, request_end in (
+            await self.session.exec(query)
+        ).all():
+            ranges[status][0].append(request_start.date())
+            ranges[status][1].append(request_end.date())
+
+        days = (end_date - start_date).days + 1
+        counts = {
+            status: time_calc.count_per_day(starts, ends, start_date, days).tolist()
+            for status, (starts, ends) in ranges.items()
+        }
+        result = [
+            {
+                "date": start_date + timedelta(days=i),
+                "count": sum(status_counts[i] for status_counts in counts.values()),
+                "statuses": (
+                    {
+                        status: status_counts[i]
+                        for status, status_counts in counts.items()
+                    }
+                    if by_status
+                    else None
+                ),
+            }
+            for i in range(days)
+        ]
+        headcount_cache.set(key, result)
         return result
 
-    def delete_leave_request(self, leave_request_id: int) -> None:
+    @staticmethod
+    def _apply_filters(
+        query: Select, filters: Optional[schemas.LeaveRequestFilter]
+    ) -> Select:
+        """
+        Narrows a leave request query down with the given filters.
+        :param query: The query to filter.
+        :param filters: The filters to apply. Leave requests overlapping the date
+        window are kept.
+        :return: The filtered query.
+        """
+        if filters is None:
+            return query
+        if filters.status is not None:
+            query = query.where(LeaveRequest.status == filters.status)
+        if filters.requester_id is not None:
+            query = query.where(LeaveRequest.requester_id == filters.requester_id)
+        if filters.start_date is not None:
+            query = query.where(LeaveRequest.end_date >= filters.start_date)
+        if filters.end_date is not None:
+            query = query.where(LeaveRequest.start_date <= filters.end_date)
+        return query
+
+    async def delete_leave_request(self, leave_request_id: int) -> bool:
         """
-        Deletes a leave request.
+        Deletes a pending leave request and refunds the leave days it was charged to
+        its requester, in a single transaction. The `DELETE` only matches while the
+        leave request is pending, so one resolved concurrently is neither deleted nor
+        refunded.
         :param leave_request_id: The id of the leave request to delete.
+        :return: True if the leave request was deleted, False if it is missing or
+        already resolved.
         """
-        leave_request = self.get_leave_request_by_id(leave_request_id)
-        self.session.delete(leave_request)
-        self.session.commit()
+        query = (
+            delete(LeaveRequest)
+            .where(
+                LeaveRequest.id == leave_request_id,
+                LeaveRequest.status == LeaveRequestStatus.pending,
+            )
+            .returning(*LEAVE_REQUEST_COLUMNS, LeaveRequest.leave_days)
+        )
+        row = (await self.session.exec(query)).one_or_none()
+        if row is None:
+            await self.session.rollback()
+            return False
 
-    def set_leave_request_status(
+        if row.requester_id is not None:
+            await UserService(self.session).adjust_remaining_leave_days(
+                row.requester_id, row.leave_days
+            )
+            await LeaveRequestCountService(self.session).adjust_counts(
+                {(row.requester_id, LeaveRequestStatus.pending): -1}
+            )
+        await self.record_change([row.requester_id])
+        await self.session.commit()
+        await events.publish_leave_request_events(
+            [_event(schemas.LeaveRequestEventType.deleted, row)]
+        )
+        return True
+
+    async def set_leave_request_status(
         self, leave_request_id: int, status: LeaveRequestStatus
     ) -> None:
         """
-        Sets the status of a leave request.
+        Sets the status of a leave request. Its row is locked before the counts are
+        changed from its current status, so concurrent changes to it take turns, and
+        the leave request, count and version rows are locked in the same order as
+        the other writes.
         :param leave_request_id: The id of the leave request to set.
         :param status: The status to set.
         """
-        leave_request = self.get_leave_request_by_id(leave_request_id)
+        leave_request = await self.get_leave_request_by_id(
+            leave_request_id, for_update=True
+        )
+        if leave_request.requester_id is not None and leave_request.status != status:
+            await LeaveRequestCountService(self.session).adjust_counts(
+                {
+                    (leave_request.requester_id, leave_request.status): -1,
+                    (leave_request.requester_id, status): 1,
+                }
+            )
         leave_request.status = status
         self.session.add(leave_request)
-        self.session.commit()
+        await self.record_change([leave_request.requester_id])
+        await self.session.commit()
+        await events.publish_leave_request_events(
+            [_event(schemas.LeaveRequestEventType.updated, leave_request)]
+        )
+
+    async def set_leave_request_statuses(
+        self, leave_request_ids: List[int], status: LeaveRequestStatus
+    ) -> Dict[int, schemas.LeaveRequestStatusOutcome]:
+        """
+        Resolves many pending leave requests at once with a single `UPDATE`.
+        :param leave_request_ids: The ids of the leave requests to set.
+        :param status: The status to set.
+        :return: The outcome for each id: updated, already resolved (not pending
+        anymore) or missing.
+        """
+        ids = set(leave_request_ids)
+        query = (
+            update(LeaveRequest)
+            .where(
+                LeaveRequest.id.in_(ids),
+                LeaveRequest.status == LeaveRequestStatus.pending,
+            )
+            .values(status=status)
+            .returning(*LEAVE_REQUEST_COLUMNS)
+        )
+        rows = (await self.session.exec(query)).all()
+        updated = {row.id for row in rows}
+        changes: Counter = Counter()
+        for row in rows:
+            if row.requester_id is not None:
+                changes[row.requester_id, LeaveRequestStatus.pending] -= 1
+                changes[row.requester_id, status] += 1
+        await LeaveRequestCountService(self.session).adjust_counts(changes)
+        if updated:
+            await self.record_change(row.requester_id for row in rows)
+        await self.session.commit()
+        await events.publish_leave_request_events(
+            [_event(schemas.LeaveRequestEventType.updated, row) for row in rows]
+        )
+
+        existing = set()
+        if ids - updated:
+            query = select(LeaveRequest.id).where(LeaveRequest.id.in_(ids - updated))
+            existing = set((await self.session.exec(query)).all())
+
+        result: Dict[int, schemas.LeaveRequestStatusOutcome] = {}
+        for id in leave_request_ids:
+            if id in updated:
+                result[id] = schemas.LeaveRequestStatusOutcome.updated
+            elif id in existing:
+                result[id] = schemas.LeaveRequestStatusOutcome.already_resolved
+            else:
+                result[id] = schemas.LeaveRequestStatusOutcome.missing
+        return result
 
-    def valid_leave_request_date_range(
-        self, requester_id: int, requested_date_range: Tuple[datetime]
+    async def valid_leave_request_date_range(
+        self,
+        requester_id: int,
+        requested_date_range: Tuple[datetime, datetime],
+        ignore_denied: bool = False,
     ) -> bool:
         """
-        Checks if a user can request for leave on a given day.
+        Checks if a user can request for leave on a given day, i.e., the requested date
+        range does not overlap any of their existing leave requests.
         :param requester_id: The id of the user to check.
         :param requested_date_range: The date range to check.
+        :param ignore_denied: Whether denied leave requests may be overlapped.
         :return: True if the user can request for leave on the given day, False otherwise.
         """
-        START_DATE_INDEX = 0
-        END_DATE_INDEX = 1
-        query = select(LeaveRequest).where(LeaveRequest.requester_id == requester_id)
+        start_date, end_date = requested_date_range
+        overlapping = select(LeaveRequest.id).where(
+            LeaveRequest.requester_id == requester_id,
+            LeaveRequest.end_date >= start_date,
+            LeaveRequest.start_date <= end_date,
+        )
+        if ignore_denied:
+            overlapping = overlapping.where(
+                LeaveRequest.status != LeaveRequestStatus.denied
+            )
+
+        query = select(exists(overlapping))
+        has_overlap: bool = (await self.session.exec(query)).one()
+        return not has_overlap
 
-        for leave_request in self.session.exec(query).all():
-            start_date_in_range = (
-                leave_request.start_date
-                <= requested_date_range[START_DATE_INDEX]
-                <= leave_request.end_date
+    async def create_leave_requests(
+        self, leave_requests: List[LeaveRequest]
+    ) -> List[schemas.LeaveRequestCreateResult]:
+        """
+        Validates and inserts many leave requests in a single transaction. The
+        requesters' rows are locked and their existing leave requests loaded once for
+        the whole batch, then the leave requests are checked in order against those
+        and against each other. Valid ones are inserted together and each requester's
+        remaining leave days are updated once.
+        :param leave_requests: The leave requests to insert.
+        :return: For each leave request, either the inserted leave request or the
+        reason it was rejected.
+        """
+        user_service = UserService(self.session)
+        requester_ids = {leave_request.requester_id for leave_request in leave_requests}
+        requesters: Dict[int, User] = {
+            user.id: user
+            for user in await user_service.get_users_by_user_ids(
+                requester_ids, for_update=True
             )
-            end_date_in_range = (
-                leave_request.start_date
-                <= requested_date_range[END_DATE_INDEX]
-                <= leave_request.end_date
+        }
+
+        query = select(
+            LeaveRequest.requester_id, LeaveRequest.start_date, LeaveRequest.end_date
+        ).where(
+            LeaveRequest.requester_id.in_(requesters),
+            LeaveRequest.status != LeaveRequestStatus.denied,
+            LeaveRequest.end_date >= min(lr.start_date for lr in leave_requests),
+            LeaveRequest.start_date <= max(lr.end_date for lr in leave_requests),
+        )
+        taken: Dict[int, List[Tuple[datetime, datetime]]] = defaultdict(list)
+        for requester_id, start_date, end_date in (
+            await self.session.exec(query)
+        ).all():
+            taken[requester_id].append((start_date, end_date))
+        remaining_leave_days: Dict[int, int] = {
+            id: user.remaining_leave_days for id, user in requesters.items()
+        }
+
+        all_days_requested = time_calc.business_days_between_many(
+            [leave_request.start_date for leave_request in leave_requests],
+            [leave_request.end_date for leave_request in leave_requests],
+        ).tolist()
+        details: List[Optional[str]] = []
+        accepted: List[LeaveRequest] = []
+        for leave_request, days_requested in zip(leave_requests, all_days_requested):
+            requester_id = leave_request.requester_id
+            detail: Optional[str] = None
+            if requester_id not in requesters:
+                detail = "Requester does not exist."
+            elif leave_request.end_date < leave_request.start_date:
+                detail = "Leave request ends before it starts."
+            elif leave_request_too_late(leave_request):
+                detail = "Leave request is too far in the future."
+            elif days_requested > remaining_leave_days[requester_id]:
+                detail = "Not enough remaining leave days."
+            elif any(
+                start_date <= leave_request.end_date
+                and end_date >= leave_request.start_date
+                for start_date, end_date in taken[requester_id]
+            ):
+                detail = "Leave request overlaps another leave request."
+            else:
+                leave_request.leave_days = days_requested
+                remaining_leave_days[requester_id] -= days_requested
+                taken[requester_id].append(
+                    (leave_request.start_date, leave_request.end_date)
+                )
+                accepted.append(leave_request)
+            details.append(detail)
+
+        self.session.add_all(accepted)
+        for requester_id, user in requesters.items():
+            days = remaining_leave_days[requester_id] - user.remaining_leave_days
+            if days:
+                await user_service.adjust_remaining_leave_days(requester_id, days)
+        await LeaveRequestCountService(self.session).adjust_counts(
+            Counter(
+                (leave_request.requester_id, LeaveRequestStatus.pending)
+                for leave_request in accepted
             )
-            if start_date_in_range:
-                return False
-            if end_date_in_range:
-                return False
-        return True
+        )
+        if accepted:
+            await self.record_change(
+                leave_request.requester_id for leave_request in accepted
+            )
+        await self.session.commit()
+        await events.publish_leave_request_events(
+            [
+                _event(schemas.LeaveRequestEventType.created, leave_request)
+                for leave_request in accepted
+            ]
+        )
+
+        return [
+            schemas.LeaveRequestCreateResult(
+                leave_request=schemas.LeaveRequestRead.model_validate(
+                    leave_request, from_attributes=True
+                )
+            )
+            if detail is None
+            else schemas.LeaveRequestCreateResult(detail=detail)
+            for leave_request, detail in zip(leave_requests, details)
+        ]
+
+    async def get_version(self) -> int:
+        """
+        Gets the change version of the leave requests, which grows with every change
+        made through this service. Cheap enough to check before running a listing.
+        :return: The current version.
+        """
+        return await VersionService(self.session).get_version(
+            LeaveRequest.__tablename__
+        )
+
+    async def record_change(self, requester_ids: Iterable[Optional[int]]) -> None:
+        """
+        Bumps the change version of the leave requests in the current transaction.
+        Every method that writes leave requests must call it last before committing.
+        The version is sharded by requester, so writes for different requesters
+        don't wait on each other.
+        :param requester_ids: The requesters of the changed leave requests.
+        """
+        await VersionService(self.session).bump_version(
+            LeaveRequest.__tablename__, (id or 0 for id in requester_ids)
+        )
 
-    def leave_request_allowed(self, leave_request: LeaveRequest) -> bool:
+    async def leave_request_allowed(
+        self, leave_request: LeaveRequest, requester: User
+    ) -> bool:
         """
         Checks if a user can request for leave.
         :param leave_request: The leave request to check.
+        :param requester: The user making the leave request.
         :return: True if the user can request for leave, False otherwise.
         """
+        if leave_request.end_date < leave_request.start_date:
+            return False
+        if leave_request_too_late(leave_request):
+            return False
 
-        current_date = datetime.now().date()
-        two_months_from_now = current_date + timedelta(days=60)
-        if leave_request.end_date.date() >= two_months_from_now:
+        days_requested: int = time_calc.business_days_between(
+            leave_request.start_date, leave_request.end_date
+        )
+        if days_requested > requester.remaining_leave_days:
             return False
 
         date_range = (leave_request.start_date, leave_request.end_date)
-        request_date_valid = self.valid_leave_request_date_range(
-            leave_request.requester_id, date_range
+        return await self.valid_leave_request_date_range(
+            requester.id, date_range, ignore_denied=True
         )
 
-        days_requested: int = days_between(
-            leave_request.start_date, leave_request.end_date
-        )
-        user: User = UserService(self.session).get_user_by_user_id(
-            leave_request.requester_id
-        )
-        has_enough_leave_days = days_requested <= user.remaining_leave_days
 
-        return request_date_valid and has_enough_leave_days
+def leave_request_too_late(leave_request: LeaveRequest) -> bool:
+    """
+    Checks if a leave request ends too far in the future to be booked yet.
+    :param leave_request: The leave request to check.
+    :return: True if the leave request ends two months or more from now.
+    """
+    current_date = datetime.now().date()
+    two_months_from_now = current_date + timedelta(days=60)
+    return leave_request.end_date.date() >= two_months_from_now
+
+
+def _event(
+    event_type: schemas.LeaveRequestEventType, leave_request: Any
+) -> schemas.LeaveRequestEvent:
+    return schemas.LeaveRequestEvent(
+        type=event_type,
+        leave_request=schemas.LeaveRequestEventSubject.model_validate(
+            leave_request, from_attributes=True
+        ),
+    )
@@ -1,22 +1,60 @@
-from sqlmodel import select
+import os
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import case, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlmodel import select, update
 
 from src.models.users import User
 from src.services.base import BaseService
+from src.utils.cache import TTLCache
+
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", 60))
+
+# Detached copies of recently authenticated users, keyed by id. Every method below that
+# mutates a user invalidates its entry; the TTL bounds staleness across workers.
+principal_cache: TTLCache[User] = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+# The key of `Session.info` holding the ids of the users changed in the current
+# transaction, or `None` for every user.
+CHANGED_USERS = "changed_user_ids"
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_changed_principals(session: Session) -> None:
+    # Invalidating before the commit would let a concurrent request cache the old row
+    # again until the TTL ran out.
+    if CHANGED_USERS not in session.info:
+        return
+    user_ids = session.info.pop(CHANGED_USERS)
+    if user_ids is None:
+        principal_cache.clear()
+    else:
+        for user_id in user_ids:
+            principal_cache.invalidate(user_id)
 
 
 class UserService(BaseService):
-    def create_user(self, user: User) -> User:
+    async def create_user(self, user: User) -> User:
         """
         Inserts a new user into the database.
         :param user: The user object containing the user information.
+        :raises IntegrityError: If the username is already taken.
         """
         self.session.add(user)
-        self.session.commit()
-        self.session.refresh(user)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+        await self.session.refresh(user)
+        principal_cache.invalidate(user.id)
 
         return user
 
-    def get_user_by_username(self, username: str) -> User:
+    async def get_user_by_username(self, username: str) -> User:
         """
         Queries the database for a user by their username.
         :param username: The username to query.
@@ -24,50 +62,109 @@ class UserService(BaseService):
         username exists.
         """
         query = select(User).where(User.username == username)
-        result = self.session.exec(query).one_or_none()
+        result = (await self.session.exec(query)).one_or_none()
 
         return result
 
-    def increment_remaining_leave_days(self, username: str, days: int) -> None:
+    async def get_user_by_user_id(
+        self, user_id: int, for_update: bool = False
+    ) -> Optional[User]:
         """
-        Increment the specified amount of days to user's remaining leave days.
-        :param username: The username of the user to query.
-        :param days: The number of days to increment.
+        Queries the database for a user by their id.
+        :param user_id: The id of the user to query.
+        :param for_update: Whether to lock the user's row (`SELECT ... FOR UPDATE`)
+        until the current transaction ends.
+        :return: `User` corresponding to the id or `None` if no user with that id
+        exists.
         """
-        user: User = self.get_user_by_username(username)
-        user.remaining_leave_days += days
-        self.session.add(user)
-        self.session.commit()
+        query = select(User).where(User.id == user_id)
+        if for_update:
+            query = query.with_for_update()
+        result = (await self.session.exec(query)).one_or_none()
+        return result
 
-    def deduct_remaining_leave_days(self, username: str, days: int) -> None:
+    async def get_users_by_user_ids(
+        self, user_ids: Iterable[int], for_update: bool = False
+    ) -> List[User]:
         """
-        Deducts the specified amount of days from user's remaining leave days.
-        :param username: The username of the user to query.
-        :param days: The number of days to deduct.
+        Queries the database for the users with the given ids.
+        :param user_ids: The ids of the users to query.
+        :param for_update: Whether to lock the users' rows until the current
+        transaction ends. Rows are locked in id order to avoid deadlocks.
+        :return: The users that exist, ordered by id.
         """
-        user: User = self.get_user_by_username(username)
-        user.remaining_leave_days -= days
-        self.session.add(user)
-        self.session.commit()
+        query = select(User).where(User.id.in_(user_ids)).order_by(User.id)
+        if for_update:
+            query = query.with_for_update()
+        result = (await self.session.exec(query)).all()
+        return result
 
-    def reset_remaining_leave_days(self, username: str) -> None:
-        # should be ran by scheduler (e.g. cronjob)
+    async def adjust_remaining_leave_days(self, user_id: int, days: int) -> None:
         """
-        Resets the remaining leave days of the user to 10.
-        :param username: The username of the user to query.
+        Atomically adds days to a user's remaining leave days, or deducts them if
+        `days` is negative. Does not commit, so it can be part of a larger transaction.
+        :param user_id: The id of the user to update.
+        :param days: The number of days to add.
         """
-        user: User = self.get_user_by_username(username)
-        user.remaining_leave_days = 10
-        self.session.add(user)
-        self.session.commit()
+        query = (
+            update(User)
+            .where(User.id == user_id)
+            .values(remaining_leave_days=User.remaining_leave_days + days)
+        )
+        await self.session.exec(query)
+        self._invalidate_after_commit(user_id)
 
-    def get_user_by_user_id(self, user_id: int) -> int:
+    async def reset_all_remaining_leave_days(
+        self,
+        quota: int,
+        max_carry_over: int = 0,
+        user_ids: Optional[Iterable[int]] = None,
+    ) -> None:
         """
-        Queries the database for a user by their id.
-        :param username: The username to query.
-        :return: `User` corresponding to the username or `None` if no user with that
-        username exists.
+        Resets the remaining leave days of every user with a single `UPDATE`. Does not
+        commit, so it can be part of a larger transaction.
+        :param quota: The number of leave days each user gets.
+        :param max_carry_over: The maximum number of unused leave days kept on top of
+        the quota.
+        :param user_ids: Only reset the users with these ids, if given.
         """
-        query = select(User).where(User.id == user_id)
-        result = self.session.exec(query).one_or_none()
-        return result
+        carry_over = case(
+            (User.remaining_leave_days <= 0, 0),
+            (User.remaining_leave_days < max_carry_over, User.remaining_leave_days),
+            else_=max_carry_over,
+        )
+        query = update(User).values(remaining_leave_days=quota + carry_over)
+        if user_ids is not None:
+            query = query.where(User.id.in_(user_ids))
+        await self.session.exec(query)
+        self._invalidate_after_commit(None)
+
+    def _invalidate_after_commit(self, user_id: Optional[int]) -> None:
+        """
+        Invalidates the principal cache once the current transaction ends.
+        :param user_id: The id of the changed user, or `None` if every user changed.
+        """
+        info = self.session.sync_session.info
+        user_ids: Optional[Set[int]] = info.get(CHANGED_USERS, set())
+        if user_ids is None or user_id is None:
+            info[CHANGED_USERS] = None
+        else:
+            user_ids.add(user_id)
+            info[CHANGED_USERS] = user_ids
+
+    async def get_principal(self, user_id: int) -> Optional[User]:
+        """
+        Gets the user making a request, from the principal cache when possible.
+        :param user_id: The id of the user.
+        :return: A detached copy of the `User` with that id or `None` if no such user
+        exists.
+        """
+        principal = principal_cache.get(user_id)
+        if principal is None:
+            user = await self.get_user_by_user_id(user_id)
+            if user is None:
+                return None
+            principal = User(**user.model_dump())
+            principal_cache.set(user_id, principal)
+
+        return principal
@@ -0,0 +1,51 @@
+import os
+from typing import Iterable
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+
+from src.models.versions import ChangeVersion
+from src.services.base import BaseService
+
+# Writers only wait on each other's version row lock when their keys fall in the same
+# shard, at the cost of readers adding up this many rows.
+CHANGE_VERSION_SHARDS = int(os.environ.get("CHANGE_VERSION_SHARDS", 64))
+
+
+class VersionService(BaseService):
+    async def bump_version(self, name: str, keys: Iterable[int]) -> None:
+        """
+        Increments the change version of a table in the current transaction, without
+        committing. Readers see the new version together with the change itself. The
+        shard rows stay locked until commit, so call it last.
+        :param name: The name of the table that changed.
+        :param keys: What the change touched, e.g. the ids of the affected users,
+        spread over the shards. Changes with keys in different shards don't wait on
+        each other.
+        """
+        # Sorted so concurrent transactions lock the rows in the same order.
+        shards = sorted({key % CHANGE_VERSION_SHARDS for key in keys}) or [0]
+        dialect = self.session.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        query = (
+            insert(ChangeVersion)
+            .values([{"name": name, "shard": shard, "version": 1} for shard in shards])
+            .on_conflict_do_update(
+                index_elements=[ChangeVersion.name, ChangeVersion.shard],
+                set_={"version": ChangeVersion.version + 1},
+            )
+        )
+        await self.session.exec(query)
+
+    async def get_version(self, name: str) -> int:
+        """
+        Gets the change version of a table, a number that grows with every change.
+        :param name: The name of the table.
+        :return: The version, or 0 if the table never changed.
+        """
+        query = select(func.sum(ChangeVersion.version)).where(
+            ChangeVersion.name == name
+        )
+        result = (await self.session.exec(query)).one()
+        return result or 0
@@ -0,0 +1,91 @@
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import src.database as database
+from src.database import get_replica_session, get_session
+from src.main import app
+from src.services import idempotency
+from src.services.leave_requests import headcount_cache
+from src.services.users import principal_cache
+from src.utils import metrics, query_budget
+
+
+@pytest.fixture(name="session")
+def session_fixture(tmp_path: Path) -> Iterator[Session]:
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture(name="client")
+def client_fixture(session: Session) -> Iterator[TestClient]:
+    url = session.get_bind().url.set(drivername="sqlite+aiosqlite")
+    async_engine = create_async_engine(url, poolclass=NullPool)
+
+    async def get_session_override() -> AsyncIterator[AsyncSession]:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_replica_session] = get_session_override
+
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_process_caches() -> Iterator[None]:
+    """Starts and ends each test without the state kept in the worker's memory."""
+
+    def clear() -> None:
+        principal_cache.clear()
+        headcount_cache.clear()
+        database.recent_writers.clear()
+        idempotency.response_cache.clear()
+        idempotency.in_flight.clear()
+
+    clear()
+    yield
+    clear()
+
+
+@pytest.fixture(autouse=True)
+def enforce_query_budgets(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Fails any request that issues more queries than its route's budget."""
+    monkeypatch.setattr(query_budget, "QUERY_BUDGET_STRICT", True)
+
+
+@pytest.fixture
+def count_queries() -> Iterator[metrics.RequestStats]:
+    """Records the queries issued by the test, outside of requests to the app."""
+    with metrics.count_queries() as stats:
+        yield stats
+
+
+def register_and_login(client: TestClient, username: str) -> str:
+    """
+    Registers a user with the password "password" and logs them in.
+    :param client: The client of the app.
+    :param username: The username, also used as the full name.
+    :return: The user's access token.
+    """
+    password = "password"
+    client.post(
+        "/register",
+        json={"username": username, "password": password, "full_name": username},
+    )
+    login_response = client.post(
+        "/token",
+        data={"username": username, "password": password, "grant_type": "password"},
+        headers={"content-type": "application/x-www-form-urlencoded"},
+    )
+    return login_response.json()["access_token"]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+import src.schemas.leave_requests as schemas
+from src.models.leave_requests import LeaveRequestStatus
+from src.models.users import User
+from src.services import events
+from src.tests.conftest import register_and_login
+from src.utils.compression import SelectiveGZipMiddleware
+
+
+def make_event(requester_id: int) -> schemas.LeaveRequestEvent:
+    return schemas.LeaveRequestEvent(
+        type=schemas.LeaveRequestEventType.created,
+        leave_request=schemas.LeaveRequestEventSubject(
+            id=requester_id,
+            requester_id=requester_id,
+            status=LeaveRequestStatus.pending,
+        ),
+    )
+
+
+def parse(message: str) -> dict:
+    return json.loads(message.split("data: ")[1])
+
+
+def test_stream_filters_events_per_user():
+    async def run() -> None:
+        user = events.stream_leave_request_events(User(id=1, is_admin=False))
+        admin = events.stream_leave_request_events(User(id=3, is_admin=True))
+        assert await anext(user) == "retry: 3000\n\n"
+        assert await anext(admin) == "retry: 3000\n\n"
+
+        await events.publish_leave_request_events([make_event(2), make_event(1)])
+
+        assert parse(await anext(user))["leave_request"]["requester_id"] == 1
+        assert parse(await anext(admin))["leave_request"]["requester_id"] == 2
+        assert parse(await anext(admin))["leave_request"]["requester_id"] == 1
+        await user.aclose()
+        await admin.aclose()
+
+    asyncio.run(run())
+
+
+def test_stream_ends_when_the_subscription_is_ended():
+    async def run() -> None:
+        user = events.stream_leave_request_events(User(id=1, is_admin=False))
+        assert await anext(user) == "retry: 3000\n\n"
+        await events.publish_leave_request_events([make_event(1)])
+
+        events.broker.end_subscriptions()
+
+        assert parse(await anext(user))["leave_request"]["requester_id"] == 1
+        with pytest.raises(StopAsyncIteration):
+            await anext(user)
+
+    asyncio.run(run())
+
+
+def test_leave_request_changes_are_published(session: Session, client: TestClient):
+    headers = {"Authorization": f"Bearer {register_and_login(client, 'test')}"}
+    admin_headers = {"Authorization": f"Bearer {register_and_login(client, 'admin')}"}
+    admin = session.exec(select(User).where(User.username == "admin")).one()
+    admin.is_admin = True
+    session.add(admin)
+    session.commit()
+    start_date = datetime.now() + timedelta(days=1)
+
+    async def run() -> List[dict]:
+        async with events.broker.subscribe(
+            events.LEAVE_REQUEST_CHANNEL
+        ) as subscription:
+            response = await asyncio.to_thread(
+                client.post,
+                "/api/create-leave-request",
+                json={
+                    "reason": "vacation",
+                    "start_date": start_date.isoformat(),
+                    "end_date": start_date.isoformat(),
+                },
+                headers=headers,
+            )
+            await asyncio.to_thread(
+                client.put,
+                f"/api/approve-leave-request/{response.json()['id']}",
+                headers=admin_headers,
+            )
+            return [await subscription.get(), await subscription.get()]
+
+    created, updated = asyncio.run(run())
+    assert created["type"] == schemas.LeaveRequestEventType.created
+    assert updated["type"] == schemas.LeaveRequestEventType.updated
+    assert updated["leave_request"]["id"] == created["leave_request"]["id"]
+    assert updated["leave_request"]["status"] == LeaveRequestStatus.approved
+
+
+def test_event_streams_are_not_gzipped():
+    async def endpoint(request: Request) -> Response:
+        media_type = request.query_params["media_type"]
+        return StreamingResponse(
+            iter([b"x" * 1000, b"x" * 1000]), media_type=media_type
+        )
+
+    app = SelectiveGZipMiddleware(Starlette(routes=[Route("/", endpoint)]), 500)
+    client = TestClient(app, headers={"Accept-Encoding": "gzip"})
+
+    response = client.get("/", params={"media_type": "text/event-stream"})
+    assert "Content-Encoding" not in response.headers
+    assert response.content == b"x" * 2000
+
+    response = client.get("/", params={"media_type": "application/x-ndjson"})
+    assert response.headers["Content-Encoding"] == "gzip"
@@ -0,0 +1,107 @@
+from pathlib import Path
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import exc
+from sqlmodel import Session, create_engine, select
+
+import src.database as database
+import src.utils.metrics as metrics
+from src.models.users import User
+from src.tests.conftest import register_and_login
+from src.utils import pools, tokens
+
+POOL_STATS_URL = "/internal/pool-stats"
+METRICS_URL = "/metrics"
+
+
+def test_pool_stats(session: Session, client: TestClient):
+    response = client.get(
+        POOL_STATS_URL,
+        headers={"Authorization": f"Bearer {register_and_login(client, 'test')}"},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    headers = {"Authorization": f"Bearer {register_and_login(client, 'admin')}"}
+    user = session.exec(select(User).where(User.username == "admin")).one()
+    user.is_admin = True
+    session.add(user)
+    session.commit()
+    response = client.get(POOL_STATS_URL, headers=headers)
+    data = response.json()
+    assert response.status_code == status.HTTP_200_OK
+    assert set(data["pools"]) == {"async_engine"}
+    assert data["pools"]["async_engine"]["checked_out"] == 0
+
+
+def test_instrumented_pool_records_checkouts_and_timeouts(tmp_path: Path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        poolclass=pools.InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        pool_status = pools.pool_status(engine.pool)
+        assert pool_status["checked_out"] == 1
+
+    assert pool_status["checkouts"] == 1
+    assert pool_status["timeouts"] == 1
+    assert pool_status["wait_seconds_max"] >= 0.01
+
+
+def test_reset_engines_after_fork_replaces_pools():
+    async_pool = database.async_engine.pool
+
+    database.reset_engines_after_fork()
+
+    assert database.async_engine.pool is not async_pool
+    assert isinstance(
+        database.async_engine.pool, pools.InstrumentedAsyncAdaptedQueuePool
+    )
+
+
+def test_metrics(
+    client: TestClient,
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 1e-9)
+    headers = {"Authorization": f"Bearer {register_and_login(client, 'test')}"}
+    client.get(POOL_STATS_URL, headers=headers)
+
+    response = client.get(METRICS_URL)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert (
+        'http_requests_total{method="GET",route="/internal/pool-stats",status="401"}'
+        in body
+    )
+    assert 'http_request_db_queries_count{method="POST",route="/register"}' in body
+    assert 'hasher_duration_seconds_count{operation="verify"}' in body
+    assert "Slow request: GET /internal/pool-stats answered 401" in caplog.text
+    assert "SELECT" in caplog.text
+
+
+def test_streamed_queries_are_recorded(session: Session, client: TestClient):
+    user = User(full_name="admin", username="admin", hashed_password=b"", is_admin=True)
+    session.add(user)
+    session.commit()
+    headers = {"Authorization": f"Bearer {tokens.create_access_token(user.id, True)}"}
+    labels = {"method": "GET", "route": "/api/export-leave-requests"}
+    # Caches the user, so the export's only query is the one made while streaming.
+    client.get("/api/export-leave-requests", headers=headers)
+    before = REGISTRY.get_sample_value("http_request_db_queries_sum", labels)
+
+    client.get("/api/export-leave-requests", headers=headers)
+
+    assert REGISTRY.get_sample_value("http_request_db_queries_sum", labels) == (
+        before + 1
+    )
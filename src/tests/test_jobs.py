@@ -0,0 +1,80 @@
+import asyncio
+from datetime import date
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.jobs.leave_reset import reset_annual_leave
+from src.jobs.scheduler import Scheduler
+from src.models.users import User
+
+
+def run_reset(session: Session, today: date, **kwargs: object) -> bool:
+    url = session.get_bind().url.set(drivername="sqlite+aiosqlite")
+
+    async def run() -> bool:
+        async_engine = create_async_engine(url, poolclass=NullPool)
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            return await reset_annual_leave(async_session, today, **kwargs)
+
+    return asyncio.run(run())
+
+
+def remaining_leave_days(session: Session) -> list:
+    session.expire_all()
+    query = select(User.remaining_leave_days).order_by(User.id)
+    return session.exec(query).all()
+
+
+def test_reset_annual_leave_once_per_year(session: Session):
+    for username, remaining in (("first", 3), ("second", 8), ("third", -1)):
+        session.add(
+            User(
+                username=username,
+                full_name=username,
+                hashed_password=b"",
+                remaining_leave_days=remaining,
+            )
+        )
+    session.commit()
+
+    assert run_reset(session, date(2026, 1, 1), quota=10, max_carry_over=5) is True
+    assert remaining_leave_days(session) == [13, 15, 10]
+
+    assert run_reset(session, date(2026, 6, 1), quota=10, max_carry_over=5) is False
+    assert remaining_leave_days(session) == [13, 15, 10]
+
+    assert run_reset(session, date(2027, 1, 1), quota=10) is True
+    assert remaining_leave_days(session) == [10, 10, 10]
+
+
+def test_reset_annual_leave_first_run_only_records_year(session: Session):
+    session.add(User(username="test", full_name="test", hashed_password=b""))
+    session.commit()
+
+    assert run_reset(session, date(2026, 6, 1), quota=20, run_if_new=False) is False
+    assert remaining_leave_days(session) == [10]
+
+    assert run_reset(session, date(2027, 1, 1), quota=20, run_if_new=False) is True
+    assert remaining_leave_days(session) == [20]
+
+
+def test_scheduler_runs_jobs_until_stopped():
+    calls = []
+
+    async def job() -> None:
+        calls.append(len(calls))
+        if len(calls) == 2:
+            raise RuntimeError("jobs that fail are retried")
+
+    async def run() -> None:
+        scheduler = Scheduler()
+        scheduler.add_job("job", job, interval=0.01)
+        scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert len(calls) > 2
@@ -1,42 +1,46 @@
+import json
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Iterator
 
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
-from sqlmodel.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel, create_engine, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.database import get_session
+import src.database as database
+from src.database import get_replica_session
 from src.main import app
-from src.models.leave_requests import LeaveRequestStatus
+from src.models.idempotency_keys import IdempotencyKey
+from src.models.leave_requests import LeaveRequest, LeaveRequestStatus
+from src.models.users import User
+from src.services import idempotency
+from src.tests.conftest import register_and_login
+from src.utils import time_calc
 
 REGISTER_URL = "/register"
 LOGIN_URL = "/token"
 CREATE_LEAVE_REQUEST = "/api/create-leave-request"
+CREATE_LEAVE_REQUESTS = "/api/create-leave-requests"
+GET_ALL_LEAVE_REQUESTS = "/api/get-all-leave-requests"
+GET_CURRENT_USER = "/api/get-current-user"
+SET_LEAVE_REQUEST_STATUSES = "/api/set-leave-request-statuses"
+GET_LEAVE_HEADCOUNT = "/api/get-leave-headcount"
+EXPORT_LEAVE_REQUESTS = "/api/export-leave-requests"
+GET_PENDING_LEAVE_REQUESTS = "/api/get-pending-leave-requests"
+GET_LEAVE_REQUEST_COUNTS = "/api/get-leave-request-counts"
 
 
-@pytest.fixture(name="session")
-def session_fixture():
-    engine = create_engine(
-        "sqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    SQLModel.metadata.create_all(engine)
-    with Session(engine) as session:
-        yield session
-
-
-@pytest.fixture(name="client")
-def client_fixture(session: Session):
-    def get_session_override() -> Session:
-        return session
-
-    app.dependency_overrides[get_session] = get_session_override
-
-    client = TestClient(app)
-    yield client
-    app.dependency_overrides.clear()
+@pytest.fixture(autouse=True)
+def every_day_is_a_working_day(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    # Most tests book days relative to today, so weekends must count like other days.
+    monkeypatch.setattr(time_calc, "WORKWEEK_MASK", "1111111")
+    time_calc.get_calendar.cache_clear()
+    yield
+    time_calc.get_calendar.cache_clear()
 
 
 def test_create_leave_request(session: Session, client: TestClient):
@@ -81,3 +85,627 @@ def test_create_leave_request(session: Session, client: TestClient):
     assert data["start_date"] == start_date.isoformat()
     assert data["end_date"] == end_date.isoformat()
     assert data["requester_id"] == registered_user.json()["id"]
+
+
+def create_leave_request(
+    client: TestClient, access_token: str, start_in_days: int, length: int = 0
+) -> dict:
+    start_date: datetime = datetime.now() + timedelta(days=start_in_days)
+    end_date: datetime = start_date + timedelta(days=length)
+    response = client.post(
+        CREATE_LEAVE_REQUEST,
+        json={
+            "reason": "vacation",
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+        },
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+def test_get_all_leave_requests_paginates(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    created = [create_leave_request(client, access_token, day) for day in (6, 2, 4)]
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    first_page = client.get(
+        GET_ALL_LEAVE_REQUESTS, params={"limit": 2}, headers=headers
+    )
+    data = first_page.json()
+    assert first_page.status_code == status.HTTP_200_OK
+    assert data["items"] == [created[1], created[2]]
+    assert data["next_cursor"] is not None
+
+    second_page = client.get(
+        GET_ALL_LEAVE_REQUESTS,
+        params={"limit": 2, "cursor": data["next_cursor"]},
+        headers=headers,
+    )
+    data = second_page.json()
+    assert [item["id"] for item in data["items"]] == [created[0]["id"]]
+    assert data["next_cursor"] is None
+
+
+def test_get_all_leave_requests_filters(session: Session, client: TestClient):
+    first_token = register_and_login(client, "first")
+    second_token = register_and_login(client, "second")
+    create_leave_request(client, first_token, 1)
+    create_leave_request(client, first_token, 10)
+    theirs = create_leave_request(client, second_token, 10)
+    headers = {"Authorization": f"Bearer {first_token}"}
+
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS,
+        params={
+            "requester_id": theirs["requester_id"],
+            "status": LeaveRequestStatus.pending.value,
+            "start_date": (datetime.now() + timedelta(days=5)).isoformat(),
+        },
+        headers=headers,
+    )
+    assert [item["id"] for item in response.json()["items"]] == [theirs["id"]]
+
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, params={"cursor": "not-a-cursor"}, headers=headers
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_get_all_leave_requests_not_modified(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    created = create_leave_request(client, access_token, 3)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response = client.get(GET_ALL_LEAVE_REQUESTS, headers=headers)
+    etag = response.headers["ETag"]
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    client.delete(f"/api/delete-leave-request/{created['id']}", headers=headers)
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert response.json()["items"] == []
+
+
+def test_create_leave_request_containing_existing_range(
+    session: Session, client: TestClient
+):
+    access_token = register_and_login(client, "test")
+    create_leave_request(client, access_token, 3)
+    start_date: datetime = datetime.now() + timedelta(days=2)
+    end_date: datetime = start_date + timedelta(days=2)
+
+    response = client.post(
+        CREATE_LEAVE_REQUEST,
+        json={
+            "reason": "vacation",
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+        },
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_create_leave_request_deducts_remaining_leave_days(
+    session: Session, client: TestClient
+):
+    access_token = register_and_login(client, "test")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    create_leave_request(client, access_token, 1, length=6)
+
+    response = client.get(GET_CURRENT_USER, headers=headers)
+    assert response.json()["remaining_leave_days"] == 3
+
+    start_date: datetime = datetime.now() + timedelta(days=20)
+    response = client.post(
+        CREATE_LEAVE_REQUEST,
+        json={
+            "reason": "vacation",
+            "start_date": start_date.isoformat(),
+            "end_date": (start_date + timedelta(days=3)).isoformat(),
+        },
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(GET_CURRENT_USER, headers=headers)
+    assert response.json()["remaining_leave_days"] == 3
+
+
+def test_leave_days_skip_weekends_and_holidays(
+    session: Session, client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = today + timedelta(days=7 - today.weekday())
+    monkeypatch.setattr(time_calc, "WORKWEEK_MASK", "1111100")
+    monkeypatch.setattr(
+        time_calc, "HOLIDAYS", (monday + timedelta(days=2)).date().isoformat()
+    )
+    time_calc.get_calendar.cache_clear()
+    access_token = register_and_login(client, "test")
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    created = create_leave_request(
+        client, access_token, (monday - datetime.now()).days + 1, length=6
+    )
+    assert created["start_date"].startswith(monday.date().isoformat())
+    response = client.get(GET_CURRENT_USER, headers=headers)
+    assert response.json()["remaining_leave_days"] == 6
+
+    client.delete(f"/api/delete-leave-request/{created['id']}", headers=headers)
+    response = client.get(GET_CURRENT_USER, headers=headers)
+    assert response.json()["remaining_leave_days"] == 10
+
+
+def test_delete_refunds_the_days_charged_to_the_requester(
+    session: Session, client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    access_token = register_and_login(client, "test")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    created = create_leave_request(client, access_token, 1, length=6)
+
+    # Days booked under the old calendar are refunded as they were charged.
+    monkeypatch.setattr(time_calc, "WORKWEEK_MASK", "1111100")
+    time_calc.get_calendar.cache_clear()
+    client.delete(
+        f"/api/delete-leave-request/{created['id']}",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+
+    users = session.exec(select(User).order_by(User.username)).all()
+    assert [(user.username, user.remaining_leave_days) for user in users] == [
+        ("admin", 10),
+        ("test", 10),
+    ]
+
+
+def test_delete_leaves_resolved_leave_requests_alone(
+    session: Session, client: TestClient
+):
+    access_token = register_and_login(client, "test")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    created = create_leave_request(client, access_token, 1, length=2)
+    client.put(
+        f"/api/approve-leave-request/{created['id']}",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    headers = {"Authorization": f"Bearer {access_token}"}
+    remaining_leave_days = client.get(GET_CURRENT_USER, headers=headers).json()[
+        "remaining_leave_days"
+    ]
+
+    response = client.delete(
+        f"/api/delete-leave-request/{created['id']}", headers=headers
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.get(GET_CURRENT_USER, headers=headers)
+    assert response.json()["remaining_leave_days"] == remaining_leave_days
+    assert session.get(LeaveRequest, created["id"]) is not None
+
+
+def make_admin(session: Session, username: str) -> None:
+    user = session.exec(select(User).where(User.username == username)).one()
+    user.is_admin = True
+    session.add(user)
+    session.commit()
+
+
+def test_set_leave_request_statuses(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    pending = create_leave_request(client, access_token, 1)
+    resolved = create_leave_request(client, access_token, 3)
+    client.put(
+        f"/api/deny-leave-request/{resolved['id']}",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    ids = [pending["id"], resolved["id"], 404]
+
+    response = client.put(
+        SET_LEAVE_REQUEST_STATUSES,
+        json={"ids": ids, "status": LeaveRequestStatus.approved.value},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.put(
+        SET_LEAVE_REQUEST_STATUSES,
+        json={"ids": ids, "status": LeaveRequestStatus.approved.value},
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"id": pending["id"], "outcome": "updated"},
+        {"id": resolved["id"], "outcome": "already_resolved"},
+        {"id": 404, "outcome": "missing"},
+    ]
+    session.expire_all()
+    assert (
+        session.get(LeaveRequest, pending["id"]).status == LeaveRequestStatus.approved
+    )
+    assert session.get(LeaveRequest, resolved["id"]).status == LeaveRequestStatus.denied
+
+
+def test_create_leave_requests(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    user = session.exec(select(User).where(User.username == "test")).one()
+    day = datetime.now() + timedelta(days=1)
+
+    def item(start_in_days: int, length: int) -> dict:
+        start_date = day + timedelta(days=start_in_days)
+        return {
+            "requester_id": user.id,
+            "reason": "team offsite",
+            "start_date": start_date.isoformat(),
+            "end_date": (start_date + timedelta(days=length)).isoformat(),
+        }
+
+    items = [item(0, 2), item(2, 0), item(10, 4), item(20, 3), item(90, 0)]
+    response = client.post(
+        CREATE_LEAVE_REQUESTS,
+        json={"items": items},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+    assert [result["detail"] for result in data] == [
+        None,
+        "Leave request overlaps another leave request.",
+        None,
+        "Not enough remaining leave days.",
+        "Leave request is too far in the future.",
+    ]
+    assert data[0]["leave_request"]["requester_id"] == user.id
+
+    session.refresh(user)
+    assert user.remaining_leave_days == 2
+
+    response = client.post(
+        CREATE_LEAVE_REQUESTS,
+        json={"items": [item(30, 0)]},
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert response.json()[0]["leave_request"]["requester_id"] == user.id
+
+    response = client.post(
+        CREATE_LEAVE_REQUESTS,
+        json={"items": [{**item(40, 0), "requester_id": user.id + 1}]},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_create_leave_request_with_reversed_range(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    start_date: datetime = datetime.now() + timedelta(days=30)
+    leave_request_info = {
+        "reason": "vacation",
+        "start_date": start_date.isoformat(),
+        "end_date": (start_date - timedelta(days=28)).isoformat(),
+    }
+
+    response = client.post(
+        CREATE_LEAVE_REQUEST, json=leave_request_info, headers=headers
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.post(
+        CREATE_LEAVE_REQUESTS, json={"items": [leave_request_info]}, headers=headers
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.get(GET_CURRENT_USER, headers=headers)
+    assert response.json()["remaining_leave_days"] == 10
+    assert session.exec(select(func.count()).select_from(LeaveRequest)).one() == 0
+
+
+def test_reads_go_to_replica_unless_client_just_wrote(
+    session: Session, client: TestClient, tmp_path: Path
+):
+    replica_path = tmp_path / "replica.db"
+    SQLModel.metadata.create_all(create_engine(f"sqlite:///{replica_path}"))
+    replica_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{replica_path}", poolclass=NullPool
+    )
+
+    async def get_replica_session_override() -> AsyncIterator[AsyncSession]:
+        async with AsyncSession(replica_engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides[get_replica_session] = get_replica_session_override
+    writer_token = register_and_login(client, "writer")
+    reader_token = register_and_login(client, "reader")
+    created = create_leave_request(client, writer_token, 1)
+    last_write = client.cookies[database.LAST_WRITE_COOKIE]
+
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, headers={"Authorization": f"Bearer {writer_token}"}
+    )
+    assert [item["id"] for item in response.json()["items"]] == [created["id"]]
+
+    # Another worker only knows about the write from the cookie.
+    database.recent_writers.clear()
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, headers={"Authorization": f"Bearer {writer_token}"}
+    )
+    assert [item["id"] for item in response.json()["items"]] == [created["id"]]
+
+    client.cookies.clear()
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, headers={"Authorization": f"Bearer {writer_token}"}
+    )
+    assert response.json()["items"] == []
+
+    client.cookies.set(database.LAST_WRITE_COOKIE, str(float(last_write) - 60))
+    response = client.get(
+        GET_ALL_LEAVE_REQUESTS, headers={"Authorization": f"Bearer {reader_token}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["items"] == []
+
+
+def test_get_leave_headcount(session: Session, client: TestClient):
+    first_token = register_and_login(client, "first")
+    second_token = register_and_login(client, "second")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    first = create_leave_request(client, first_token, 1, length=2)
+    second = create_leave_request(client, second_token, 2, length=2)
+    client.put(
+        SET_LEAVE_REQUEST_STATUSES,
+        json={"ids": [first["id"]], "status": LeaveRequestStatus.approved.value},
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    headers = {"Authorization": f"Bearer {first_token}"}
+    today = datetime.now().date()
+    params = {
+        "start_date": today.isoformat(),
+        "end_date": (today + timedelta(days=5)).isoformat(),
+    }
+
+    response = client.get(GET_LEAVE_HEADCOUNT, params=params, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [day["count"] for day in response.json()] == [0, 1, 2, 2, 1, 0]
+
+    response = client.get(
+        GET_LEAVE_HEADCOUNT, params={**params, "by_status": True}, headers=headers
+    )
+    assert response.json()[3]["statuses"] == {"pending": 1, "approved": 1}
+
+    client.delete(
+        f"/api/delete-leave-request/{second['id']}",
+        headers={"Authorization": f"Bearer {second_token}"},
+    )
+    response = client.get(GET_LEAVE_HEADCOUNT, params=params, headers=headers)
+    assert [day["count"] for day in response.json()] == [0, 1, 1, 1, 0, 0]
+
+    response = client.get(
+        GET_LEAVE_HEADCOUNT,
+        params={**params, "end_date": (today - timedelta(days=1)).isoformat()},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_export_leave_requests(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    created = [create_leave_request(client, access_token, day) for day in (1, 5, 9)]
+    client.put(
+        f"/api/deny-leave-request/{created[1]['id']}",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = client.get(
+        EXPORT_LEAVE_REQUESTS, headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.get(EXPORT_LEAVE_REQUESTS, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "id,requester_id,reason,status,start_date,end_date"
+    assert lines[2].split(",")[:4] == [
+        str(created[1]["id"]),
+        str(created[1]["requester_id"]),
+        "vacation",
+        "denied",
+    ]
+    assert len(lines) == 4
+
+    response = client.get(
+        EXPORT_LEAVE_REQUESTS,
+        params={"format": "ndjson", "status": LeaveRequestStatus.pending.value},
+        headers=headers,
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        created[0],
+        created[2],
+    ]
+
+
+def test_get_pending_leave_requests(session: Session, client: TestClient):
+    access_token = register_and_login(client, "test")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    created = [create_leave_request(client, access_token, day) for day in (6, 2, 4, 1)]
+    client.put(f"/api/approve-leave-request/{created[3]['id']}", headers=admin_headers)
+
+    response = client.get(
+        GET_PENDING_LEAVE_REQUESTS,
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.get(
+        GET_PENDING_LEAVE_REQUESTS, params={"limit": 2}, headers=admin_headers
+    )
+    data = response.json()
+    assert data["items"] == [created[1], created[2]]
+
+    response = client.get(
+        GET_PENDING_LEAVE_REQUESTS,
+        params={"limit": 2, "cursor": data["next_cursor"]},
+        headers=admin_headers,
+    )
+    assert response.json() == {"items": [created[0]], "next_cursor": None}
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        GET_PENDING_LEAVE_REQUESTS,
+        headers={**admin_headers, "If-None-Match": etag},
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.put(f"/api/deny-leave-request/{created[0]['id']}", headers=admin_headers)
+    response = client.get(
+        GET_PENDING_LEAVE_REQUESTS,
+        headers={**admin_headers, "If-None-Match": etag},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["items"] == [created[1], created[2]]
+
+
+def test_leave_request_counts_follow_changes(session: Session, client: TestClient):
+    first_token = register_and_login(client, "first")
+    second_token = register_and_login(client, "second")
+    admin_token = register_and_login(client, "admin")
+    make_admin(session, "admin")
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    first = [create_leave_request(client, first_token, day) for day in (1, 3, 5, 7)]
+    second = create_leave_request(client, second_token, 1)
+    start_date = (datetime.now() + timedelta(days=10)).isoformat()
+    client.post(
+        CREATE_LEAVE_REQUESTS,
+        json={
+            "items": [
+                {"reason": "trip", "start_date": start_date, "end_date": start_date}
+            ]
+        },
+        headers={"Authorization": f"Bearer {second_token}"},
+    )
+    client.put(f"/api/approve-leave-request/{first[0]['id']}", headers=admin_headers)
+    client.put(f"/api/deny-leave-request/{first[1]['id']}", headers=admin_headers)
+    client.put(
+        SET_LEAVE_REQUEST_STATUSES,
+        json={"ids": [first[2]["id"], second["id"]], "status": "approved"},
+        headers=admin_headers,
+    )
+    client.delete(
+        f"/api/delete-leave-request/{first[3]['id']}",
+        headers={"Authorization": f"Bearer {first_token}"},
+    )
+
+    response = client.get(
+        GET_LEAVE_REQUEST_COUNTS,
+        params={"by_requester": True},
+        headers={"Authorization": f"Bearer {first_token}"},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.get(
+        GET_LEAVE_REQUEST_COUNTS, params={"by_requester": True}, headers=admin_headers
+    )
+    data = response.json()
+    assert data["counts"] == {"pending": 1, "approved": 3, "denied": 1}
+    assert data["requesters"] == [
+        {
+            "requester_id": first[0]["requester_id"],
+            "counts": {"pending": 0, "approved": 2, "denied": 1},
+        },
+        {
+            "requester_id": second["requester_id"],
+            "counts": {"pending": 1, "approved": 1, "denied": 0},
+        },
+    ]
+    query = select(LeaveRequest.status, func.count()).group_by(LeaveRequest.status)
+    assert dict(session.exec(query).all()) == {
+        status: count for status, count in data["counts"].items() if count
+    }
+
+    response = client.get(
+        GET_LEAVE_REQUEST_COUNTS,
+        params={"requester_id": second["requester_id"]},
+        headers=admin_headers,
+    )
+    assert response.json() == {
+        "counts": {"pending": 1, "approved": 1, "denied": 0},
+        "requesters": None,
+    }
+
+
+@pytest.mark.parametrize("store", ["memory", "database"])
+def test_create_leave_request_with_idempotency_key(
+    session: Session,
+    client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+    store: str,
+):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_STORE", store)
+    idempotency.response_cache.clear()
+    access_token = register_and_login(client, "test")
+    start_date: datetime = datetime.now() + timedelta(days=1)
+    leave_request_info = {
+        "reason": "vacation",
+        "start_date": start_date.isoformat(),
+        "end_date": (start_date + timedelta(days=2)).isoformat(),
+    }
+    headers = {"Authorization": f"Bearer {access_token}", "Idempotency-Key": "abc"}
+
+    first = client.post(CREATE_LEAVE_REQUEST, json=leave_request_info, headers=headers)
+    assert first.status_code == status.HTTP_201_CREATED
+    assert "Idempotent-Replayed" not in first.headers
+    if store == "database":
+        # As if the retry reached another worker.
+        idempotency.response_cache.clear()
+
+    retry = client.post(CREATE_LEAVE_REQUEST, json=leave_request_info, headers=headers)
+    assert retry.status_code == status.HTTP_201_CREATED
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+
+    response = client.get(
+        GET_CURRENT_USER, headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.json()["remaining_leave_days"] == 7
+    assert session.exec(select(func.count()).select_from(LeaveRequest)).one() == 1
+    stored = session.exec(select(IdempotencyKey)).all()
+    assert [key.resource_id for key in stored] == (
+        [first.json()["id"]] if store == "database" else []
+    )
+
+    response = client.post(
+        CREATE_LEAVE_REQUEST,
+        json={**leave_request_info, "reason": "trip"},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.post(
+        CREATE_LEAVE_REQUEST,
+        json={**leave_request_info, "reason": "trip"},
+        headers={**headers, "Idempotency-Key": "def"},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    idempotency.response_cache.clear()
@@ -0,0 +1,135 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import Connection, inspect
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import src.database as database
+import src.schemas.leave_requests as schemas
+from src.models.leave_requests import LeaveRequestStatus
+from src.services.leave_requests import LeaveRequestService
+from src.services.users import UserService
+from src.utils import metrics
+
+
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(tmp_path: Path) -> AsyncEngine:
+    return create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool
+    )
+
+
+def test_migrations_match_models(async_engine: AsyncEngine):
+    def compare(connection: Connection) -> list:
+        return compare_metadata(
+            MigrationContext.configure(connection), SQLModel.metadata
+        )
+
+    async def run() -> list:
+        await database.migrate(async_engine)
+        async with async_engine.connect() as connection:
+            return await connection.run_sync(compare)
+
+    assert asyncio.run(run()) == []
+
+
+def test_migrate_adopts_database_created_without_migrations(
+    async_engine: AsyncEngine,
+):
+    def create_legacy_schema(connection: Connection) -> None:
+        config = Config()
+        config.set_main_option("script_location", str(database.MIGRATIONS_DIR))
+        config.attributes["connection"] = connection
+        command.upgrade(config, database.INITIAL_REVISION)
+        connection.exec_driver_sql("DROP TABLE alembic_version")
+        connection.exec_driver_sql("DROP TABLE jobrun")
+
+    def get_username_index(connection: Connection) -> dict:
+        inspector = inspect(connection)
+        assert inspector.has_table("jobrun")
+        return next(
+            index
+            for index in inspector.get_indexes("user")
+            if index["name"] == "ix_user_username"
+        )
+
+    async def run() -> dict:
+        async with async_engine.begin() as connection:
+            await connection.run_sync(create_legacy_schema)
+        await database.migrate(async_engine)
+        async with async_engine.connect() as connection:
+            return await connection.run_sync(get_username_index)
+
+    assert asyncio.run(run())["unique"]
+
+
+def explain(async_engine: AsyncEngine, queries: List[metrics.Query]) -> str:
+    engine = create_engine(async_engine.url.set(drivername="sqlite"))
+    with engine.connect() as connection:
+        plans = [
+            connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {query.statement}", query.parameters
+            ).all()
+            for query in queries
+        ]
+    return "\n".join(str(row) for plan in plans for row in plan)
+
+
+@pytest.mark.parametrize(
+    "run_query, index",
+    [
+        (
+            lambda session: UserService(session).get_user_by_username("test"),
+            "ix_user_username",
+        ),
+        (
+            lambda session: LeaveRequestService(session).valid_leave_request_date_range(
+                1, (datetime.now(), datetime.now() + timedelta(days=1))
+            ),
+            "ix_leaverequest_requester_id_end_date_start_date",
+        ),
+        (
+            lambda session: LeaveRequestService(session).get_all_leave_requests(
+                schemas.LeaveRequestFilter(), limit=50
+            ),
+            "ix_leaverequest_start_date_id",
+        ),
+        (
+            lambda session: LeaveRequestService(session).get_all_leave_requests(
+                schemas.LeaveRequestFilter(status=LeaveRequestStatus.pending),
+                limit=50,
+                cursor=(datetime.now(), 1),
+            ),
+            "ix_leaverequest_status_start_date_id",
+        ),
+    ],
+)
+def test_hot_queries_use_indexes(
+    async_engine: AsyncEngine,
+    count_queries: metrics.RequestStats,
+    run_query: Callable[[AsyncSession], Awaitable[object]],
+    index: str,
+):
+    async def run() -> List[metrics.Query]:
+        await database.migrate(async_engine)
+        async with AsyncSession(async_engine) as session:
+            before = len(count_queries.queries)
+            await run_query(session)
+            return count_queries.queries[before:]
+
+    queries = asyncio.run(run())
+
+    assert re.search(
+        rf"USING (COVERING )?INDEX {index}\b", explain(async_engine, queries)
+    )
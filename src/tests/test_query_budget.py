@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.models.leave_requests import LeaveRequest
+from src.models.users import User
+from src.routers import leave_requests, users
+from src.services.leave_requests import LeaveRequestService
+from src.utils import metrics, query_budget, tokens
+
+
+def test_repeated_queries():
+    stats = metrics.RequestStats(
+        [
+            metrics.Query("SELECT * FROM user WHERE id = ?", (1,), 0.001),
+            metrics.Query("SELECT *\n  FROM user WHERE id = ?", (1,), 0.001),
+            metrics.Query("SELECT * FROM user WHERE id = ?", (2,), 0.001),
+            metrics.Query("DELETE FROM user WHERE id = ?", (1,), 0.001),
+        ]
+    )
+
+    assert query_budget.repeated_queries(stats) == [
+        query_budget.RepeatedQuery("SELECT * FROM user WHERE id = ?", 3, 1)
+    ]
+    report = query_budget.describe_queries(stats)
+    assert "3x (1 identical)  SELECT * FROM user WHERE id = ?" in report
+
+
+def test_request_over_budget_fails(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(users.register, "query_budget", 1)
+
+    with pytest.raises(query_budget.QueryBudgetExceeded, match="budget of 1"):
+        client.post(
+            "/register",
+            json={"username": "test", "password": "password", "full_name": "test"},
+        )
+
+
+def test_streamed_queries_count_against_the_budget(
+    session: Session, client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    user = User(full_name="admin", username="admin", hashed_password=b"", is_admin=True)
+    session.add(user)
+    session.commit()
+    token = tokens.create_access_token(user.id, True)
+    headers = {"Authorization": f"Bearer {token}"}
+    # Caches the user, so the export's only query is the one made while streaming.
+    client.get("/api/export-leave-requests", headers=headers)
+    monkeypatch.setattr(leave_requests.export_leave_requests, "query_budget", 0)
+
+    with pytest.raises(query_budget.QueryBudgetExceeded, match="issued 1 queries"):
+        client.get("/api/export-leave-requests", headers=headers)
+
+
+def test_batch_queries_dont_grow_with_batch_size(
+    session: Session, count_queries: metrics.RequestStats
+):
+    user = User(full_name="test", username="test", hashed_password=b"")
+    session.add(user)
+    session.commit()
+    url = session.get_bind().url.set(drivername="sqlite+aiosqlite")
+    async_engine = create_async_engine(url, poolclass=NullPool)
+    day = datetime.now() + timedelta(days=1)
+
+    async def create(size: int) -> metrics.RequestStats:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            before = len(count_queries.queries)
+            await LeaveRequestService(session).create_leave_requests(
+                [
+                    LeaveRequest(
+                        requester_id=user.id,
+                        reason="vacation",
+                        start_date=day + timedelta(days=i),
+                        end_date=day + timedelta(days=i),
+                    )
+                    for i in range(size)
+                ]
+            )
+            return metrics.RequestStats(count_queries.queries[before:])
+
+    stats = asyncio.run(create(5))
+    # SQLite can't return the ids of a multi-row INSERT in order, so the rows are
+    # inserted one by one there. Postgres inserts them in a single statement.
+    repeated = query_budget.repeated_queries(stats)
+    assert len(repeated) == 1
+    assert repeated[0].statement.startswith("INSERT INTO leaverequest")
+    assert repeated[0].count == 5
@@ -1,38 +1,21 @@
+import asyncio
+import threading
+
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
-from sqlmodel.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 import src.utils.hasher as hasher
-from src.database import get_session
-from src.main import app
+from src.models.users import User
+from src.services.users import UserService
+from src.utils import tokens
 
 REGISTER_URL = "/register"
-
-
-@pytest.fixture(name="session")
-def session_fixture():
-    engine = create_engine(
-        "sqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    SQLModel.metadata.create_all(engine)
-    with Session(engine) as session:
-        yield session
-
-
-@pytest.fixture(name="client")
-def client_fixture(session: Session):
-    def get_session_override() -> Session:
-        return session
-
-    app.dependency_overrides[get_session] = get_session_override
-
-    client = TestClient(app)
-    yield client
-    app.dependency_overrides.clear()
+GET_CURRENT_USER_URL = "/api/get-current-user"
 
 
 def test_create_user(session: Session, client: TestClient):
@@ -88,4 +71,77 @@ def test_login_user(session: Session, client: TestClient):
     data = response.json()
     assert response.status_code == status.HTTP_200_OK
     assert data["token_type"] == "bearer"
-    assert data["access_token"] == username
+    payload = tokens.decode_access_token(data["access_token"])
+    user = session.exec(select(User).where(User.username == username)).one()
+    assert payload.user_id == user.id
+    assert payload.is_admin is False
+
+
+def test_get_current_user_is_cached(session: Session, client: TestClient):
+    test_create_user(session, client)
+    user = session.exec(select(User).where(User.username == "test")).one()
+    headers = {"Authorization": f"Bearer {tokens.create_access_token(user.id, False)}"}
+
+    response = client.get(GET_CURRENT_USER_URL, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["username"] == "test"
+
+    user.full_name = "renamed behind the cache's back"
+    session.add(user)
+    session.commit()
+    response = client.get(GET_CURRENT_USER_URL, headers=headers)
+    assert response.json()["full_name"] == "test user"
+
+
+def test_principal_cache_is_invalidated_after_commit(session: Session):
+    user = User(full_name="test", username="test", hashed_password=b"")
+    session.add(user)
+    session.commit()
+    url = session.get_bind().url.set(drivername="sqlite+aiosqlite")
+    async_engine = create_async_engine(url, poolclass=NullPool)
+
+    async def run() -> int:
+        async with AsyncSession(async_engine) as writer, AsyncSession(
+            async_engine
+        ) as reader:
+            await UserService(writer).adjust_remaining_leave_days(user.id, -3)
+            # A concurrent request caches the row as it was before the commit.
+            await UserService(reader).get_principal(user.id)
+            await writer.commit()
+            principal = await UserService(reader).get_principal(user.id)
+            return principal.remaining_leave_days
+
+    assert asyncio.run(run()) == 7
+
+
+def test_get_current_user_with_invalid_token(session: Session, client: TestClient):
+    test_create_user(session, client)
+
+    response = client.get(
+        GET_CURRENT_USER_URL, headers={"Authorization": "Bearer test"}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    token = tokens.create_access_token(1, False)
+    header, _, signature = token.split(".")
+    forged = f"{header}.{tokens._encode({'sub': 1, 'adm': True, 'exp': 2**40})}"
+    response = client.get(
+        GET_CURRENT_USER_URL, headers={"Authorization": f"Bearer {forged}.{signature}"}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_create_user_when_hasher_saturated(
+    session: Session, client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    saturated = threading.BoundedSemaphore(1)
+    saturated.acquire()
+    monkeypatch.setattr(hasher, "_pending", saturated)
+
+    response = client.post(
+        REGISTER_URL,
+        json={"username": "test", "password": "password", "full_name": "test user"},
+    )
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,216 @@
+import abc
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional, Set
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+
+
+class SubscriptionClosed(Exception):
+    """Raised once a subscription was ended, e.g. because messages may have been lost."""
+
+
+class Subscription:
+    """A bounded queue of the messages published on a channel since subscribing."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._loop = asyncio.get_running_loop()
+        # `None` marks the end of the subscription.
+        self._queue: asyncio.Queue[Optional[Message]] = asyncio.Queue(maxsize)
+        self._closed = False
+
+    def put(self, message: Message) -> None:
+        """
+        Queues a message, dropping the oldest one if the subscriber can't keep up. Safe
+        to call from any thread.
+        :param message: The message to queue.
+        """
+        self._put_threadsafe(message)
+
+    def close(self) -> None:
+        """
+        Ends the subscription once the messages already queued are read. Safe to call
+        from any thread.
+        """
+        self._put_threadsafe(None)
+
+    async def get(self) -> Message:
+        """
+        Waits for the next message.
+        :return: The message.
+        :raises SubscriptionClosed: If the subscription was ended.
+        """
+        if self._closed:
+            raise SubscriptionClosed()
+        message = await self._queue.get()
+        if message is None:
+            self._closed = True
+            raise SubscriptionClosed()
+        return message
+
+    def _put_threadsafe(self, message: Optional[Message]) -> None:
+        try:
+            running_loop: Optional[
+                asyncio.AbstractEventLoop
+            ] = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._put_nowait(message)
+        else:
+            self._loop.call_soon_threadsafe(self._put_nowait, message)
+
+    def _put_nowait(self, message: Optional[Message]) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(message)
+
+
+class Broker(abc.ABC):
+    """Delivers messages published on a channel to every subscriber of that channel."""
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: Message) -> None:
+        """
+        Publishes a message.
+        :param channel: The channel to publish on.
+        :param message: A JSON serializable message.
+        """
+
+    async def publish_many(self, channel: str, messages: List[Message]) -> None:
+        """
+        Publishes messages, in order.
+        :param channel: The channel to publish on.
+        :param messages: JSON serializable messages.
+        """
+        for message in messages:
+            await self.publish(channel, message)
+
+    @abc.abstractmethod
+    def subscribe(self, channel: str) -> AsyncContextManager[Subscription]:
+        """
+        Subscribes to a channel for the duration of an `async with` block.
+        :param channel: The channel to subscribe to.
+        :return: A context manager giving the subscription.
+        """
+
+    async def close(self) -> None:
+        """Releases the resources held by the broker."""
+
+
+class LocalBroker(Broker):
+    """Delivers messages to subscribers in this process only."""
+
+    def __init__(self, queue_size: int = 100) -> None:
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    async def publish(self, channel: str, message: Message) -> None:
+        self._deliver(channel, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[Subscription]:
+        subscription = Subscription(self.queue_size)
+        self._subscriptions[channel].add(subscription)
+        try:
+            await self._on_subscribe(channel)
+            yield subscription
+        finally:
+            self._subscriptions[channel].discard(subscription)
+            if not self._subscriptions[channel]:
+                del self._subscriptions[channel]
+
+    def end_subscriptions(self) -> None:
+        """
+        Ends every subscription, so subscribers know they may have missed messages.
+        """
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+
+    async def _on_subscribe(self, channel: str) -> None:
+        pass
+
+    def _deliver(self, channel: str, message: Message) -> None:
+        for subscription in list(self._subscriptions.get(channel, ())):
+            subscription.put(message)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Shares messages between worker processes with Postgres `LISTEN`/`NOTIFY`. Each
+    process keeps one connection that listens on the channels its subscribers use, and
+    delivers what it hears to them locally.
+    """
+
+    def __init__(self, dsn: str, queue_size: int = 100) -> None:
+        super().__init__(queue_size)
+        self.dsn = dsn
+        self._connection: Optional[asyncpg.Connection] = None
+        self._listening: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    async def publish(self, channel: str, message: Message) -> None:
+        await self.publish_many(channel, [message])
+
+    async def publish_many(self, channel: str, messages: List[Message]) -> None:
+        # One round trip for the whole batch. Each payload must stay under the 8000
+        # bytes Postgres allows, and identical ones are only delivered once.
+        if not messages:
+            return
+        async with self._lock:
+            connection = await self._connect()
+            await connection.execute(
+                "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+                channel,
+                [json.dumps(message) for message in messages],
+            )
+
+    async def close(self) -> None:
+        async with self._lock:
+            connection, self._connection = self._connection, None
+            if connection is not None:
+                await connection.close()
+            self._listening.clear()
+
+    async def _on_subscribe(self, channel: str) -> None:
+        async with self._lock:
+            await self._connect()
+            await self._listen(channel)
+
+    async def _connect(self) -> asyncpg.Connection:
+        if self._connection is None or self._connection.is_closed():
+            self._connection = await asyncpg.connect(self.dsn)
+            self._connection.add_termination_listener(self._on_termination)
+            self._listening.clear()
+            # Channels subscribed to before the connection was lost.
+            for channel in list(self._subscriptions):
+                await self._listen(channel)
+        return self._connection
+
+    async def _listen(self, channel: str) -> None:
+        if channel not in self._listening:
+            await self._connection.add_listener(channel, self._on_notification)
+            self._listening.add(channel)
+
+    def _on_notification(
+        self, connection: asyncpg.Connection, pid: int, channel: str, payload: str
+    ) -> None:
+        self._deliver(channel, json.loads(payload))
+
+    def _on_termination(self, connection: asyncpg.Connection) -> None:
+        if connection is not self._connection:
+            return
+        # Messages sent until the next connection listens are lost, so the subscribers
+        # are ended and they resubscribe, which reconnects.
+        logger.warning("Lost the event broker connection, ending the subscriptions.")
+        self._connection = None
+        self._listening.clear()
+        self.end_subscriptions()
@@ -0,0 +1,59 @@
+from typing import Collection
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Streams whose chunks must reach the client as they're sent, which gzip would buffer.
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream",)
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """Gzips responses like `GZipMiddleware`, except those of the given media types."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        compresslevel: int = 9,
+        excluded_media_types: Collection[str] = UNCOMPRESSED_MEDIA_TYPES,
+    ) -> None:
+        super().__init__(app, minimum_size, compresslevel)
+        self.excluded_media_types = excluded_media_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = _SelectiveGZipResponder(
+                    self.app,
+                    self.minimum_size,
+                    self.compresslevel,
+                    self.excluded_media_types,
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _SelectiveGZipResponder(GZipResponder):
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int,
+        compresslevel: int,
+        excluded_media_types: Collection[str],
+    ) -> None:
+        super().__init__(app, minimum_size, compresslevel)
+        self.excluded_media_types = excluded_media_types
+        self.excluded = False
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("Content-Type", "")
+            media_type = content_type.split(";")[0].strip().lower()
+            self.excluded = media_type in self.excluded_media_types
+        if self.excluded:
+            await self.send(message)
+        else:
+            await super().send_with_gzip(message)
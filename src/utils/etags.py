@@ -0,0 +1,26 @@
+from typing import Optional
+
+
+def make_etag(*parts: object) -> str:
+    """
+    Builds a strong entity tag from the values a response depends on.
+    :param parts: The values, e.g. a change version.
+    :return: The quoted entity tag.
+    """
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an `If-None-Match` header against the current entity tag.
+    :param if_none_match: The header value, if the client sent one.
+    :param etag: The current entity tag, as built by `make_etag`.
+    :return: True if the client's copy is current and a 304 can be sent.
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
@@ -0,0 +1,44 @@
+import csv
+import io
+from typing import Any, Iterable, Sequence
+
+import orjson
+
+
+def encode_csv_header(columns: Sequence[str]) -> str:
+    """
+    Encodes the header line of a CSV export.
+    :param columns: The column names.
+    :return: The CSV line.
+    """
+    return encode_csv_rows([columns])
+
+
+def encode_csv_rows(rows: Iterable[Sequence[Any]]) -> str:
+    """
+    Encodes rows as CSV lines. Enums are written as their values and datetimes in ISO
+    format.
+    :param rows: The rows to encode.
+    :return: The CSV lines.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def encode_ndjson_rows(rows: Iterable[Any]) -> bytes:
+    """
+    Encodes rows as newline delimited JSON, one object per row.
+    :param rows: The rows to encode, with an `_asdict` method.
+    :return: The JSON lines.
+    """
+    return b"".join(
+        orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows
+    )
+
+
+def _csv_value(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return getattr(value, "value", value)
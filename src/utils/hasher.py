@@ -1,5 +1,30 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
 import bcrypt
 
+from src.utils import metrics
+
+T = TypeVar("T")
+
+# bcrypt releases the GIL while hashing, so threads are enough to keep it off the event
+# loop. A process pool can be selected for deployments that want full isolation.
+HASHER_EXECUTOR = os.environ.get("HASHER_EXECUTOR", "thread")
+HASHER_WORKERS = int(os.environ.get("HASHER_WORKERS", min(4, os.cpu_count() or 1)))
+HASHER_MAX_PENDING = int(os.environ.get("HASHER_MAX_PENDING", 64))
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(HASHER_MAX_PENDING)
+
+
+class HasherBusyError(Exception):
+    """Raised when too many hashing jobs are already queued."""
+
 
 def hash(password: str) -> bytes:
     """
@@ -18,3 +43,60 @@ def verify(password: str, hashed_password: bytes) -> bool:
     :return: True if passwords match, False otherwise.
     """
     return bcrypt.checkpw(password.encode("utf-8"), hashed_password)
+
+
+async def hash_async(password: str) -> bytes:
+    """
+    Hashes a password on the hasher worker pool.
+    :param password: The password to hash.
+    :return: The hashed password.
+    :raises HasherBusyError: If the worker pool queue is full.
+    """
+    return await _run(hash, password)
+
+
+async def verify_async(password: str, hashed_password: bytes) -> bool:
+    """
+    Checks a password against a hashed password on the hasher worker pool.
+    :param password: The plaintext password.
+    :param hashed_password: The hashed password.
+    :return: True if passwords match, False otherwise.
+    :raises HasherBusyError: If the worker pool queue is full.
+    """
+    return await _run(verify, password, hashed_password)
+
+
+def shutdown() -> None:
+    """Shuts down the hasher worker pool, if it was started."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if HASHER_EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(max_workers=HASHER_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=HASHER_WORKERS, thread_name_prefix="hasher"
+                )
+        return _executor
+
+
+async def _run(fn: Callable[..., T], *args: object) -> T:
+    if not _pending.acquire(blocking=False):
+        raise HasherBusyError("Too many password hashing jobs queued.")
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending.release()
+        metrics.HASHER_DURATION.labels(fn.__name__).observe(
+            time.perf_counter() - started
+        )
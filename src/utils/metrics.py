@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, ExceptionContext
+
+logger = logging.getLogger(__name__)
+
+# When set, every worker writes its metrics there and `/metrics` aggregates them, so
+# any worker can answer a scrape. `python -m src.server` sets it up.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# Requests slower than this are logged with their queries, 0 disables it.
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 0))
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response is sent, per route.",
+    ["method", "route"],
+)
+REQUESTS = Counter(
+    "http_requests_total",
+    "Responses sent, per route and status.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries issued per request, per route.",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in database queries per request, per route.",
+    ["method", "route"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Time spent in each database query."
+)
+HASHER_DURATION = Histogram(
+    "hasher_duration_seconds",
+    "Time taken by password hashing jobs, including time queued.",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5, 10),
+)
+
+
+class Query(NamedTuple):
+    statement: str
+    parameters: Any
+    duration: float
+
+
+@dataclass
+class RequestStats:
+    """The database queries issued while handling one request."""
+
+    queries: List[Query] = field(default_factory=list)
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def start_request() -> RequestStats:
+    """
+    Starts recording the queries issued by the current task and the tasks it starts.
+    :return: The stats the queries are recorded into.
+    """
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+@contextmanager
+def count_queries() -> Iterator[RequestStats]:
+    """
+    Records the queries issued inside the block, by the current task and the tasks it
+    starts, e.g. `with count_queries() as stats: ...` then `len(stats.queries)`.
+    :return: A context manager giving the stats the queries are recorded into.
+    """
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def record_request(
+    method: str, route: str, status: int, duration: float, stats: RequestStats
+) -> None:
+    """
+    Records a handled request, and logs it if it was slow.
+    :param method: The HTTP method.
+    :param route: The path template of the route that handled it.
+    :param status: The response status code.
+    :param duration: How long it took until the response was sent, in seconds.
+    :param stats: The queries it issued.
+    """
+    REQUEST_DURATION.labels(method, route).observe(duration)
+    REQUESTS.labels(method, route, status).inc()
+    REQUEST_QUERIES.labels(method, route).observe(len(stats.queries))
+    REQUEST_DB_DURATION.labels(method, route).observe(stats.db_seconds)
+
+    if SLOW_REQUEST_SECONDS and duration >= SLOW_REQUEST_SECONDS:
+        queries = "".join(
+            f"\n  {query.duration * 1e3:8.2f} ms  {' '.join(query.statement.split())}"
+            for query in stats.queries
+        )
+        logger.warning(
+            "Slow request: %s %s answered %s in %.0f ms, %d queries took %.0f ms.%s",
+            method,
+            route,
+            status,
+            duration * 1e3,
+            len(stats.queries),
+            stats.db_seconds * 1e3,
+            queries,
+        )
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Renders every metric in the Prometheus text format.
+    :return: The body and its content type.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+    connection: Connection, cursor: Any, statement: str, *args: Any
+) -> None:
+    connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+    connection: Connection, cursor: Any, statement: str, parameters: Any, *args: Any
+) -> None:
+    duration = time.perf_counter() - connection.info["query_started"].pop()
+    DB_QUERY_DURATION.observe(duration)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries.append(Query(statement, parameters, duration))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context: ExceptionContext) -> None:
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
@@ -0,0 +1,35 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+MAX_PAGE_SIZE = 200
+DEFAULT_PAGE_SIZE = 50
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(start_date: datetime, id: int) -> str:
+    """
+    Encodes a keyset position into an opaque cursor string.
+    :param start_date: The start date of the last row on the page.
+    :param id: The id of the last row on the page.
+    :return: A url-safe cursor string.
+    """
+    raw = f"{start_date.isoformat()}|{id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """
+    Decodes a cursor string produced by `encode_cursor`.
+    :param cursor: The cursor string.
+    :return: The `(start_date, id)` keyset position.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        start_date, id = raw.split("|")
+        return datetime.fromisoformat(start_date), int(id)
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError("Malformed cursor.") from e
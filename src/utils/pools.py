@@ -0,0 +1,97 @@
+import threading
+import time
+from typing import Dict, Union
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection, QueuePool
+
+
+class PoolStats:
+    """Counters describing how connections are checked out of a pool."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_max = 0
+
+    def record_checkout(self, wait_seconds: float, overflow: int) -> None:
+        """
+        Records a successful checkout.
+        :param wait_seconds: How long the checkout took.
+        :param overflow: The pool overflow right after the checkout.
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def record_timeout(self, wait_seconds: float) -> None:
+        """
+        Records a checkout that timed out because the pool was exhausted.
+        :param wait_seconds: How long the checkout waited.
+        """
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+class InstrumentedPoolMixin:
+    """Times every checkout of a `QueuePool` and keeps counters in `self.stats`."""
+
+    stats: PoolStats
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self) -> "InstrumentedPoolMixin":
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def connect(self) -> PoolProxiedConnection:
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_timeout(time.perf_counter() - started)
+            raise
+        self.stats.record_checkout(time.perf_counter() - started, self.overflow())
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_status(
+    pool: Union[InstrumentedQueuePool, InstrumentedAsyncAdaptedQueuePool]
+) -> Dict[str, Union[int, float]]:
+    """
+    Describes the current state of an instrumented pool.
+    :param pool: The pool to describe.
+    :return: The pool's configuration, current usage and checkout counters.
+    """
+    stats = pool.stats
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "overflow_max": stats.overflow_max,
+        "checkouts": stats.checkouts,
+        "timeouts": stats.timeouts,
+        "wait_seconds_total": stats.wait_seconds_total,
+        "wait_seconds_max": stats.wait_seconds_max,
+    }
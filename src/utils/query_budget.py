@@ -0,0 +1,116 @@
+import logging
+import os
+from collections import Counter
+from typing import Any, Callable, List, NamedTuple, Optional, TypeVar
+
+from starlette.routing import BaseRoute
+
+from src.utils.metrics import RequestStats
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Whether a request over its route's query budget raises instead of being logged. The
+# tests turn it on, so a change that adds queries to a route fails them.
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "false").lower() == "true"
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request issues more queries than its budget."""
+
+
+class RepeatedQuery(NamedTuple):
+    statement: str
+    count: int
+    # How many of them also had the same parameters as an earlier one.
+    identical: int
+
+
+def query_budget(limit: int) -> Callable[[F], F]:
+    """
+    Declares the most queries a route may issue per request. Goes below the route
+    decorator.
+    :param limit: The number of queries.
+    :return: A decorator recording the budget on the endpoint.
+    """
+
+    def decorator(endpoint: F) -> F:
+        endpoint.query_budget = limit
+        return endpoint
+
+    return decorator
+
+
+def get_query_budget(route: Optional[BaseRoute]) -> Optional[int]:
+    """
+    Gets the query budget of a route.
+    :param route: The route that handled a request, if any did.
+    :return: The budget, or None if the route doesn't declare one.
+    """
+    return getattr(getattr(route, "endpoint", None), "query_budget", None)
+
+
+def repeated_queries(stats: RequestStats) -> List[RepeatedQuery]:
+    """
+    Finds the statements issued more than once, the sign of an N+1 query or of data
+    that could have been kept from an earlier query.
+    :param stats: The queries of a request.
+    :return: The repeated statements, most repeated first.
+    """
+    statements = Counter(" ".join(query.statement.split()) for query in stats.queries)
+    calls = Counter(
+        (" ".join(query.statement.split()), repr(query.parameters))
+        for query in stats.queries
+    )
+    identical: Counter = Counter()
+    for (statement, _), count in calls.items():
+        identical[statement] += count - 1
+    return [
+        RepeatedQuery(statement, count, identical[statement])
+        for statement, count in statements.most_common()
+        if count > 1
+    ]
+
+
+def describe_queries(stats: RequestStats) -> str:
+    """
+    Lists the queries of a request, followed by the repeated ones.
+    :param stats: The queries of a request.
+    :return: A report with one line per query.
+    """
+    lines = [
+        f"  {query.duration * 1e3:8.2f} ms  {' '.join(query.statement.split())}"
+        for query in stats.queries
+    ]
+    repeated = repeated_queries(stats)
+    if repeated:
+        lines.append("Repeated:")
+        lines.extend(
+            f"  {query.count}x ({query.identical} identical)  {query.statement}"
+            for query in repeated
+        )
+    return "\n".join(lines)
+
+
+def check_query_budget(
+    method: str, route: Optional[BaseRoute], stats: RequestStats
+) -> None:
+    """
+    Logs a request that issued more queries than its route's budget.
+    :param method: The HTTP method.
+    :param route: The route that handled the request, if any did.
+    :param stats: The queries it issued.
+    :raises QueryBudgetExceeded: If over budget and `QUERY_BUDGET_STRICT` is set.
+    """
+    budget = get_query_budget(route)
+    if budget is None or len(stats.queries) <= budget:
+        return
+
+    message = (
+        f"{method} {route.path} issued {len(stats.queries)} queries, "
+        f"over its budget of {budget}:\n{describe_queries(stats)}"
+    )
+    if QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
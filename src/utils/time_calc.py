@@ -1,11 +1,99 @@
-from datetime import datetime
+import functools
+import os
+from datetime import date, datetime
+from typing import List, Sequence
 
+import numpy as np
 
-def days_between(start_date: datetime, end_date: datetime) -> int:
+# Which days of the week, Monday first, are working days.
+WORKWEEK_MASK = os.environ.get("WORKWEEK_MASK", "1111100")
+# Public holidays, as ISO dates separated by commas, and/or a file with one per line.
+HOLIDAYS = os.environ.get("HOLIDAYS", "")
+HOLIDAYS_FILE = os.environ.get("HOLIDAYS_FILE")
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def load_holidays() -> List[date]:
+    """
+    Reads the public holidays from `HOLIDAYS` and `HOLIDAYS_FILE`. Blank lines and
+    lines starting with `#` in the file are skipped.
+    :return: The holidays.
+    """
+    entries = HOLIDAYS.split(",")
+    if HOLIDAYS_FILE:
+        with open(HOLIDAYS_FILE) as file:
+            entries.extend(line for line in file if not line.startswith("#"))
+    return [date.fromisoformat(entry.strip()) for entry in entries if entry.strip()]
+
+
+@functools.lru_cache(maxsize=None)
+def get_calendar() -> np.busdaycalendar:
+    """
+    Builds the working day calendar once per process. Call `get_calendar.cache_clear()`
+    after changing the settings above.
+    :return: The calendar of working days.
+    """
+    return np.busdaycalendar(weekmask=WORKWEEK_MASK, holidays=load_holidays())
+
+
+def business_days_between(start_date: datetime, end_date: datetime) -> int:
     """
-    Calculates the number of days between two dates
+    Calculates the number of working days between two dates, both included, skipping
+    weekends and public holidays.
     :param start_date: The first date.
-    :param end_date: The second date.
-    :return:
+    :param end_date: The last date.
+    :return: The number of working days.
+    """
+    return int(business_days_between_many([start_date], [end_date])[0])
+
+
+def business_days_between_many(
+    start_dates: Sequence[datetime], end_dates: Sequence[datetime]
+) -> np.ndarray:
+    """
+    Calculates the number of working days of many date ranges in a single call.
+    :param start_dates: The first date of each range.
+    :param end_dates: The last date of each range, included.
+    :return: The number of working days of each range.
+    """
+    starts = to_datetime64(start_dates)
+    ends = to_datetime64(end_dates) + 1
+    return np.busday_count(starts, ends, busdaycal=get_calendar())
+
+
+def to_datetime64(dates: Sequence[date]) -> np.ndarray:
+    """
+    Converts dates, or the date part of datetimes, to a NumPy array of days. Much
+    faster than letting NumPy convert the objects one by one.
+    :param dates: The dates to convert.
+    :return: The array of `datetime64[D]`.
+    """
+    ordinals = np.fromiter((d.toordinal() for d in dates), np.int64, len(dates))
+    return (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]")
+
+
+def count_per_day(
+    start_dates: Sequence[date], end_dates: Sequence[date], first_day: date, days: int
+) -> np.ndarray:
+    """
+    Counts how many of the given date ranges cover each day of a window, with a
+    difference array: +1 where a range starts, -1 after it ends, then a running sum.
+    :param start_dates: The first day of each range.
+    :param end_dates: The last day of each range, inclusive.
+    :param first_day: The first day of the window.
+    :param days: The number of days in the window.
+    :return: The number of ranges covering each day of the window.
     """
-    return (end_date - start_date).days + 1
+    origin = np.datetime64(first_day, "D")
+    starts = (to_datetime64(start_dates) - origin).astype(np.int64)
+    ends = (to_datetime64(end_dates) - origin).astype(np.int64)
+    # Ranges sticking out of the window are cut to it; the ones fully outside of it
+    # end up starting after they end and cancel out.
+    starts = np.clip(starts, 0, days)
+    ends = np.clip(ends + 1, 0, days)
+    keep = starts < ends
+    difference = np.bincount(starts[keep], minlength=days + 1) - np.bincount(
+        ends[keep], minlength=days + 1
+    )
+    return np.cumsum(difference[:days])
@@ -0,0 +1,89 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass
+
+# Every worker must share the same key for tokens to validate across them, so it should
+# be set explicitly in production. The fallback only suits a single process.
+TOKEN_SECRET_KEY = os.environ.get("TOKEN_SECRET_KEY") or secrets.token_urlsafe(32)
+TOKEN_TTL_SECONDS = int(os.environ.get("TOKEN_TTL_SECONDS", 8 * 60 * 60))
+
+_HEADER = {"alg": "HS256", "typ": "JWT"}
+
+
+class InvalidTokenError(ValueError):
+    """Raised when an access token is malformed, tampered with or expired."""
+
+
+@dataclass(frozen=True)
+class TokenPayload:
+    user_id: int
+    is_admin: bool
+    expires_at: int
+
+
+def create_access_token(user_id: int, is_admin: bool) -> str:
+    """
+    Creates a signed access token (an HS256 JWT) for a user.
+    :param user_id: The id of the user the token is for.
+    :param is_admin: Whether the user is an admin.
+    :return: The access token.
+    """
+    payload = {
+        "sub": user_id,
+        "adm": is_admin,
+        "exp": int(time.time()) + TOKEN_TTL_SECONDS,
+    }
+    signing_input = f"{_encode(_HEADER)}.{_encode(payload)}"
+    return f"{signing_input}.{_sign(signing_input)}"
+
+
+def decode_access_token(token: str) -> TokenPayload:
+    """
+    Verifies an access token created by `create_access_token`.
+    :param token: The access token.
+    :return: The payload carried by the token.
+    :raises InvalidTokenError: If the token is malformed, tampered with or expired.
+    """
+    try:
+        header, payload, signature = token.split(".")
+    except ValueError as e:
+        raise InvalidTokenError("Malformed token.") from e
+
+    if not hmac.compare_digest(signature, _sign(f"{header}.{payload}")):
+        raise InvalidTokenError("Invalid token signature.")
+
+    try:
+        claims = json.loads(_b64decode(payload))
+        result = TokenPayload(
+            user_id=int(claims["sub"]),
+            is_admin=bool(claims["adm"]),
+            expires_at=int(claims["exp"]),
+        )
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise InvalidTokenError("Malformed token.") from e
+
+    if result.expires_at <= time.time():
+        raise InvalidTokenError("Token expired.")
+    return result
+
+
+def _encode(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(signing_input: str) -> str:
+    digest = hmac.new(
+        TOKEN_SECRET_KEY.encode("utf-8"), signing_input.encode("utf-8"), hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")